@@ -1,58 +1,39 @@
+from Simulator_Checkpoint import *
+from Simulator_Config import *
+from Simulator_Profiler import *
+from Simulator_Topology import *
 from Simulator_Utility import *
-
-"""
-Establishing the properties of the network.
-The process count refers to the number of nodes/miners in the system.
-Connection count refers to the number of automaton assigned to each connection to schedule block arrivals.
-"""
-process_count = 1000
-connection_count = 3
-block_interval  = 5
-transaction_count = [1650, 1300, 2000]
-transaction_size = [0.64, 0.41, 0.75]
-connection_speed = (8.7/(600/block_interval))
-genesis = Block()
-
-"""
-Various filenames for file output.
-"""
-filename = "./Bitcoin Runs/Simulation_Output_" + str(time.time()) + ".txt"
-transit_file = "./Bitcoin Runs/Transit_Values_" + str(time.time()) + ".txt"
-block_file = "./Bitcoin Runs/Size_Averages" + str(time.time()) + ".txt"
-interval_file = "./Bitcoin Runs/Interval_Averages" + str(time.time()) + ".txt"
-b_interval_file = "./Bitcoin Runs/Legit_Interval_Averages" + str(time.time()) + ".txt"
-stale_file = "./Bitcoin Runs/Stale_Percentage" + str(time.time()) + ".txt"
-
-"""
-Establishing indicator arrays that are used to extract averages.
-"""
-intervals = []
-interval_averages = []
-b_intervals = []
-b_interval_averages = []
-transits = []
-transit_averages = []
-sizes = []
-size_averages = []
-stale_averages = []
+from collections import deque
+import sys
 
 '''
 Process class represents the miners in a PoW blockchain network.
 Their network power is depicted by their merit.
 '''
 class Process(Pyc.CComponent):
-    def __init__(self, name, address, merit, blocktree, genesis, oracle):
+    def __init__(self, name, address, merit, blocktree, genesis, oracle, environment):
         Pyc.CComponent.__init__(self, name)
         self.connections = []
         self.blocktree = blocktree
         self.oracle = oracle
-        self.pendingBlocks = []
-        self.idleQueue = []
-        self.knownBlocks = [genesis]
+        self.environment = environment
+        self.clock = environment.clock
+        self.samplers = environment.samplers
+        self.indicators = environment.indicators
+        self.idleQueue = deque()
+        self.waitingArrivals = []
+        self.eventPropagation = environment.config.propagation == "event"
+        self.freeConnections = environment.config.connection_count
+        self.topology = None
+        self.sideIds = set()
+        self.pendingIds = set()
+        self.tip = genesis
+        self.index = int(address) - 1
+        self.tipDepths = None
         self.leadingBlock = genesis
 
-        self.v_connectionSpeed = self.addVariable("Mean Transit Time", Pyc.TVarType.t_float, connection_speed)
-        self.v_lastBlock = self.addVariable("Last Block", Pyc.TVarType.t_string, genesis.hash)
+        self.v_connectionSpeed = self.addVariable("Mean Transit Time", Pyc.TVarType.t_float, environment.config.connection_speed)
+        self.v_lastBlock = self.addVariable("Last Block", Pyc.TVarType.t_int, genesis.id)
         self.v_merit = self.addVariable("Merit", Pyc.TVarType.t_int, merit)
         self.v_address = self.addVariable("Address", Pyc.TVarType.t_string, address)
 
@@ -96,8 +77,8 @@ class Process(Pyc.CComponent):
         self.claimToWorking.addSensitiveMethod("New Pending Block", self.newPendingBlock)
 
     def generate_block_properties(self):
-        tr_size = generateBoundedExponential(transaction_size)
-        tr_count = generateBoundedExponential(transaction_count)
+        tr_size = self.samplers.transaction_size.sample()
+        tr_count = self.samplers.transaction_count.sample()
         size = [tr_size * (tr_count), tr_size, tr_count]
         return size
 
@@ -105,66 +86,178 @@ class Process(Pyc.CComponent):
         properties = self.generate_block_properties()
         father = self.leadingBlock
         author = self.v_address.value()
-        block = Block(father, author, properties)
+        block = Block(father, author, properties, self.clock.now(), self.environment.newBlockId(), self.environment.config.hash_blocks)
         self.leadingBlock = block
-        self.knownBlocks.append(block)
+        self.addKnownBlock(block)
+        printBlockDetails(block, self.environment.filename)
+        self.blockIndicator(block, self.indicators.sizes)
+        """
+        With a block log, a block mined below the finalised depth is rejected and dropped straight away, father link included.
+        """
         self.blocktree.updateBlocktree(block)
-        printBlockDetails(block, filename)
-        self.blockIndicator(block, sizes)
 
-    def newPendingBlock(self):
-        new_pending = self.blocktree.blocks[self.r_appendedBlock.value(0)]
-        self.pendingBlocks.append(new_pending)
+    def newPendingBlock(self, new_pending=None):
+        if new_pending is None:
+            new_pending = self.blocktree.blocks[self.r_appendedBlock.value(0)]
+        self.pendingIds.add(new_pending.id)
+        if self.eventPropagation:
+            if self.freeConnections > 0:
+                self.dispatchBlock(new_pending)
+            else:
+                self.idleQueue.append(new_pending)
+            return
         for connection in self.connections:
             if connection.currentBlock is None:
-                connection.currentBlock = new_pending
-                connection.currentTransitTime = np.random.exponential(self.v_connectionSpeed.value())
-                transits.append(connection.currentTransitTime)
-                self.transitIndicator()
+                connection.startTransit(new_pending)
                 return
         #print("The connections for process", self.v_address.value() ,"are full!\n")
         self.idleQueue.append(new_pending)
 
     def receiveBlock(self, block):
-        if block.depth > self.knownBlocks[-1].depth:
+        if block.depth > self.tip.depth:
             self.leadingBlock = block
-        self.knownBlocks.append(block)
-        self.pendingBlocks.remove(block)
+        self.addKnownBlock(block)
+        self.pendingIds.discard(block.id)
+
+    '''
+    A block is only received once its father is known, so the ancestors of a known block are known too.
+    The tip, the first known block at the greatest depth, therefore stands for its whole branch and only the known blocks off it are kept, as a set of ids.
+    When a deeper block arrives on another branch, the old branch down to the fork joins the side ids and the new one leaves them.
+    Pending blocks are kept as a set of block ids and the tip's depth is mirrored in the simulator's array.
+    Blocks at or below the blocktree's finalised depth have been dropped from memory and count as known by every process.
+    '''
+    def addKnownBlock(self, block):
+        finalised_depth = self.blocktree.finalised_depth
+        if block.depth <= self.tip.depth:
+            if block.depth > finalised_depth:
+                self.sideIds.add(block.id)
+            return
+        if block.father is not self.tip:
+            left, right = self.tip, block.father
+            while left is not right and left.depth > finalised_depth:
+                self.sideIds.add(left.id)
+                self.sideIds.discard(right.id)
+                left, right = left.father, right.father
+        self.tip = block
+        self.tipDepths[self.index] = block.depth
+
+    '''
+    A block off the tip's branch is known if its id is in the side ids, one on it if walking back from the tip reaches it.
+    Blocks are looked up close to the tip, so the walk stays short.
+    '''
+    def knows(self, block):
+        if block.depth <= self.blocktree.finalised_depth:
+            return True
+        if block.depth > self.tip.depth:
+            return False
+        if block.id in self.sideIds:
+            return True
+        ancestor = self.tip
+        while ancestor.depth > block.depth:
+            ancestor = ancestor.father
+        return ancestor is block
+
+    def knowsFather(self, block):
+        return block.depth - 1 <= self.blocktree.finalised_depth or self.knows(block.father)
+
+    def isPending(self, block):
+        return block is not None and block.id in self.pendingIds
+
+    '''
+    Event propagation: a free connection is taken and the block's arrival is scheduled on the event clock.
+    As with the connection automata, transit is measured from the block's creation.
+    '''
+    def dispatchBlock(self, block):
+        self.freeConnections -= 1
+        transit = self.samplers.exponential.sample() * self.v_connectionSpeed.value()
+        self.indicators.transits.append(transit)
+        self.transitIndicator()
+        self.clock.schedule(max(0.0, block.timestamp + transit - self.clock.now()), self.arriveBlock, block)
+
+    '''
+    Event propagation: an arrived block is held on its connection until its father is known.
+    Once received, the connection is freed and picks up the next block from the idle queue.
+    '''
+    def arriveBlock(self, block):
+        if not self.knowsFather(block):
+            self.waitingArrivals.append((self.arriveBlock, (block,)))
+            return
+        self.receiveBlock(block)
+        self.freeConnections += 1
+        if len(self.idleQueue) > 0:
+            self.dispatchBlock(self.idleQueue.popleft())
+        self.releaseWaiting()
+
+    '''
+    Gossip relay over the peer-to-peer topology: the block is sent to every neighbour that has not seen it yet.
+    Each link delays the block by its latency plus the block's transmission time over its bandwidth.
+    '''
+    def relayBlock(self, block):
+        peers = self.blocktree.processes
+        neighbours, delays = self.topology.links(self.index, block.size)
+        for neighbour, delay in zip(neighbours.tolist(), delays.tolist()):
+            peer = peers[neighbour]
+            if peer.isNewBlock(block):
+                peer.pendingIds.add(block.id)
+                self.indicators.transits.append(delay)
+                self.transitIndicator()
+                self.clock.schedule(delay, peer.arriveRelay, block)
+
+    '''
+    A relayed block is held until its father is known, then received and relayed onwards.
+    '''
+    def arriveRelay(self, block):
+        if not self.knowsFather(block):
+            self.waitingArrivals.append((self.arriveRelay, (block,)))
+            return
+        self.receiveBlock(block)
+        self.relayBlock(block)
+        self.releaseWaiting()
+
+    '''
+    Retries the arrivals held back because their block's father was still unknown (event clock only).
+    '''
+    def releaseWaiting(self):
+        waiting = self.waitingArrivals
+        self.waitingArrivals = []
+        for callback, args in waiting:
+            callback(*args)
 
     def blockIndicator(self, block, sizes):
+        indicators = self.indicators
         sizes.append(block.size)
-        b_intervals.append(block.timestamp - block.father.timestamp)
+        indicators.b_intervals.append(block.timestamp - block.father.timestamp)
         if len(sizes) % 10 == 0:
-            size_averages.append(np.mean(sizes))
-            b_interval_averages.append(np.mean(b_intervals))
-            print(size_averages[-1], file=open(block_file, "at"))
-            print(b_interval_averages[-1], file=open(b_interval_file, "at"))
+            indicators.record("Size_Averages", np.mean(sizes))
+            indicators.record("Legit_Interval_Averages", np.mean(indicators.b_intervals))
             sizes.clear()
-            b_intervals.clear()
+            indicators.b_intervals.clear()
 
+    '''
+    Called after every transit drawn, by the connections and dispatches as well as the gossip relay.
+    '''
     def transitIndicator(self):
-        if len(transits) == process_count * 10:
-            transit_averages.append(np.mean(transits))
-            print(transit_averages[-1], file=open(transit_file, "at"))
-            transits.clear()
+        indicators = self.indicators
+        if len(indicators.transits) >= self.environment.config.process_count * 10:
+            indicators.record("Transit_Values", np.mean(indicators.transits))
+            indicators.transits.clear()
 
     def workingCondition(self):
         if self.r_appendedBlock.value(0) != self.v_lastBlock.value():
-            for i in range(0, len(self.pendingBlocks)):
-                if self.pendingBlocks[i].hash == self.r_appendedBlock.value(0):
-                    return False
-            for i in range(0, len(self.knownBlocks)):
-                if self.knownBlocks[i].hash == self.r_appendedBlock.value(0):
-                    return False
-            return True
+            return self.isNewBlock(self.blocktree.blocks[self.r_appendedBlock.value(0)])
         return False
 
+    def isNewBlock(self, block):
+        return block.id not in self.pendingIds and not self.knows(block)
+
 
 class ProcessConnection(Pyc.CComponent):
     def __init__(self, name, parent):
         Pyc.CComponent.__init__(self, name)
 
         self.parent = parent
+        self.number = len(parent.connections)
+        self.clock = parent.clock
         self.currentBlock = None
         self.currentTransitTime = 0
 
@@ -176,26 +269,46 @@ class ProcessConnection(Pyc.CComponent):
 
         self.idleToTransit = self.idle.addTransition("Idle-to-Transit")
         self.idleToTransit.addTarget(self.transit, Pyc.TTransType.trans)
-        self.idleToTransit.setCondition(lambda: self.currentBlock in parent.pendingBlocks)
+        self.idleToTransit.setCondition(lambda: parent.isPending(self.currentBlock))
 
         self.transitToArrived = self.transit.addTransition("Transit-to-Arrived")
         self.transitToArrived.addTarget(self.arrived, Pyc.TTransType.trans)
-        self.transitToArrived.setCondition(lambda: time.time() - self.currentBlock.timestamp > self.currentTransitTime)
+        self.transitToArrived.setCondition(lambda: self.clock.now() - self.currentBlock.timestamp > self.currentTransitTime)
 
         self.arrivedToIdle = self.arrived.addTransition("Arrived-to-Idle")
         self.arrivedToIdle.addTarget(self.idle, Pyc.TTransType.trans)
-        self.arrivedToIdle.setCondition(lambda: self.currentBlock.father in parent.knownBlocks)
+        self.arrivedToIdle.setCondition(lambda: parent.knowsFather(self.currentBlock))
 
         self.arrivedToIdle.addSensitiveMethod("Receive Block", self.receiveBlock)
 
+    '''
+    Places a block on the connection and draws its transit time.
+    Transit is measured from the block's creation, so the event clock schedules the arrival relative to its timestamp.
+    '''
+    def startTransit(self, block):
+        self.currentBlock = block
+        self.currentTransitTime = self.parent.samplers.exponential.sample() * self.parent.v_connectionSpeed.value()
+        self.parent.indicators.transits.append(self.currentTransitTime)
+        self.parent.transitIndicator()
+        arrival = block.timestamp + self.currentTransitTime
+        self.clock.schedule(max(0.0, arrival - self.clock.now()), self.arrive)
+
+    '''
+    Arrival event of the event clock, mirrors the Transit-to-Arrived and Arrived-to-Idle transitions.
+    '''
+    def arrive(self):
+        if self.parent.knowsFather(self.currentBlock):
+            self.receiveBlock()
+            self.parent.releaseWaiting()
+        else:
+            self.parent.waitingArrivals.append((self.arrive, ()))
+
     def receiveBlock(self):
         #print((time.time()- self.currentBlock.timestamp) - self.currentTransitTime)
-        if self.currentBlock.father in self.parent.knownBlocks:
+        if self.parent.knowsFather(self.currentBlock):
             self.parent.receiveBlock(self.currentBlock)
             if len(self.parent.idleQueue) > 0:
-                self.currentBlock = self.parent.idleQueue.pop(0)
-                self.currentTransitTime = np.random.exponential(self.parent.v_connectionSpeed.value())
-                transits.append(self.currentTransitTime)
+                self.startTransit(self.parent.idleQueue.popleft())
             else:
                 self.currentBlock = None
                 self.currentTransitTime = None
@@ -205,14 +318,31 @@ Block Tree class represent the collection of blocks in the network.
 Uses depth values to identify the ordering of blocks.§
 '''
 class Blocktree(Pyc.CComponent):
-    def __init__(self, name):
+    def __init__(self, name, genesis, environment):
         Pyc.CComponent.__init__(self, name)
-        self.blocks = {genesis.hash: genesis}
+        self.indicators = environment.indicators
+        self.blocks = {genesis.id: genesis}
+        self.depths = {genesis.depth: [genesis]}
+        self.chain = {genesis.depth: genesis}
+        self.tip = genesis
+        self.height = genesis.depth
         self.discarded_blocks = {}
         self.processes = []
         self.orphan_count = 0
 
-        self.v_appendedBlock = self.addVariable("Appended Block", Pyc.TVarType.t_string, genesis.hash)
+        """
+        Running totals of the accepted (genesis included) and rejected blocks, kept as blocks may be dropped from memory.
+        With a block log, the blocks confirmation_depth below the height are finalised and streamed to it.
+        """
+        self.accepted_count = 1
+        self.discarded_count = 0
+        self.blocklog = environment.blocklog
+        self.confirmation_depth = environment.config.confirmation_depth
+        self.finalised_depth = 0
+        self.finalised_block = None
+        self.rejected_depths = {}
+
+        self.v_appendedBlock = self.addVariable("Appended Block", Pyc.TVarType.t_int, genesis.id)
         self.r_lastBlock = self.addReference("Last Block")
         self.r_selection = self.addReference("Selected Process")
 
@@ -223,39 +353,113 @@ class Blocktree(Pyc.CComponent):
         self.addMessageBox("System Oracle")
         self.addMessageBoxImport("System Oracle", self.r_selection, "Token Holder")
 
+    '''
+    Longest chain fork choice: every block joining the tree is accepted, the tip being the first block seen at the greatest depth.
+    All blocks carry the same work, so a block's depth is the cumulative work of its branch.
+    A side branch growing past the tip becomes the main chain, the blocks it replaces turn stale.
+    Stale blocks are the accepted blocks off the main chain, so the orphan count grows by one less than the height.
+    '''
     def updateBlocktree(self, block):
-        lastBlock = list(self.blocks.values())[-1]
-        if block.depth > lastBlock.depth:
-            self.blocks.update({block.hash: block})
-            self.v_appendedBlock.setValue(block.hash)
-            print("[Block Accepted]: Creator ID:", block.process, "at depth:", block.depth, "\n")
-        elif block.father == lastBlock.father and block.depth == lastBlock.depth:
-            counter = 1
-            self.orphan_count += 1
-            self.processes[int(lastBlock.process) - 1].knownBlocks.append(block)
-            self.blocks.update({block.hash: block})
-            self.v_appendedBlock.setValue(block.hash)
-            while True:
-                checkBlock = list(self.blocks.values())[-counter]
-                if checkBlock.depth == block.depth:
-                    if block not in self.processes[int(checkBlock.process) -1].knownBlocks:
-                        self.processes[int(self.r_selection.value(0)) - 1].knownBlocks.append(block)
-                        print("Adding Block to Contending Process")
-                    counter += 1
-                    if checkBlock not in self.processes[int(block.process) - 1].knownBlocks:
-                        self.processes[int(self.r_selection.value(0)) - 1].knownBlocks.append(checkBlock)
-                else:
-                    break
-            print("[BLOCKCHAIN SPLIT]: Creator ID:", block.process, "at depth:", block.depth, "\n")
+        if self.joins(block):
+            height = self.height
+            self.accepted_count += 1
+            abandoned = self.addBlock(block)
+            self.orphan_count += 1 - (self.height - height)
+            self.v_appendedBlock.setValue(block.id)
+            if self.tip is not block:
+                print("[BLOCKCHAIN SPLIT]: Creator ID:", block.process, "at depth:", block.depth, "\n")
+            elif abandoned > 0:
+                self.indicators.metrics.record("Reorganisation_Depth", abandoned)
+                print("[CHAIN REORGANISED]: Creator ID:", block.process, "at depth:", block.depth, "replacing", abandoned, "blocks\n")
+            else:
+                print("[Block Accepted]: Creator ID:", block.process, "at depth:", block.depth, "\n")
         else:
             print("[BLOCK REJECTED]: Creator Address:", block.process, "at depth:", block.depth)
-            self.discarded_blocks.update({block.hash: block})
+            self.discarded_count += 1
+            if self.blocklog is not None and block.depth <= self.finalised_depth:
+                self.dropBlock(block, 2)
+            else:
+                self.discarded_blocks.update({block.id: block})
+                if self.blocklog is not None:
+                    self.rejected_depths.setdefault(block.depth, []).append(block)
+        if self.blocklog is not None:
+            self.finaliseBlocks()
         self.staleIndicator()
 
+    '''
+    A block joins the tree when its father is in it, or is the last finalised block.
+    A block that would become the tip also needs its branch to leave the main chain above the finalised depth.
+    '''
+    def joins(self, block):
+        father = block.father
+        if father.id not in self.blocks and father is not self.finalised_block:
+            return False
+        return block.depth <= self.height or father is self.tip or self.branch(father) is not None
+
+    '''
+    Blocks of a branch missing from the main chain, walking back from the given block to the fork point.
+    The main chain is indexed by depth, so the walk costs the length of the fork and not of the chain.
+    Returns None for a branch forking at or below the finalised depth.
+    '''
+    def branch(self, block):
+        blocks = []
+        while self.chain.get(block.depth) is not block:
+            if block.depth <= self.finalised_depth:
+                return None
+            blocks.append(block)
+            block = block.father
+        return blocks
+
+    '''
+    Inserts an accepted block, keeping the blocks found at each depth and the main chain.
+    A block deeper than the tip becomes the new tip, its branch replacing the main chain down to the fork point.
+    Returns the number of main chain blocks replaced.
+    '''
+    def addBlock(self, block):
+        self.blocks.update({block.id: block})
+        self.depths.setdefault(block.depth, []).append(block)
+        if block.depth <= self.height:
+            return 0
+        abandoned = 0
+        if block.father is not self.tip:
+            for branchBlock in self.branch(block.father):
+                self.chain[branchBlock.depth] = branchBlock
+                abandoned += 1
+        self.chain[block.depth] = block
+        self.tip = block
+        self.height = block.depth
+        return abandoned
+
+    '''
+    Finalises every depth more than confirmation_depth below the chain height.
+    Its main chain, stale and rejected blocks are streamed to the block log and dropped from the blocktree.
+    The main chain keeps the last finalised block, where the branches still in memory are walked back to.
+    '''
+    def finaliseBlocks(self):
+        while self.finalised_depth < self.height - self.confirmation_depth:
+            self.finalised_depth += 1
+            self.chain.pop(self.finalised_depth - 1, None)
+            self.finalised_block = self.chain[self.finalised_depth]
+            for block in self.depths.pop(self.finalised_depth, []):
+                del self.blocks[block.id]
+                self.dropBlock(block, 0 if block is self.finalised_block else 1)
+            for block in self.rejected_depths.pop(self.finalised_depth, []):
+                del self.discarded_blocks[block.id]
+                self.dropBlock(block, 2)
+
+    '''
+    Logs a block and drops its id from every process.
+    Its father link is cut, so the finalised chain is no longer kept alive by the blocks still in memory.
+    '''
+    def dropBlock(self, block, status):
+        self.blocklog.append(block, status)
+        for process in self.processes:
+            process.sideIds.discard(block.id)
+        block.father = None
+
     def staleIndicator(self):
-        if len(self.blocks.values()) % 100 == 0:
-            stale_averages.append(self.orphan_count)
-            print(stale_averages[-1], file=open(stale_file, "at"))
+        if self.accepted_count % 100 == 0:
+            self.indicators.record("Stale_Percentage", self.orphan_count)
             self.orphan_count = 0
 
 
@@ -266,17 +470,24 @@ Randomly selects the next winning process based on their merit.
 '''
 class Oracle(Pyc.CComponent):
 
-    def __init__(self, name, total_merit):
+    def __init__(self, name, total_merit, environment):
         Pyc.CComponent.__init__(self, name)
 
+        self.clock = environment.clock
+        self.samplers = environment.samplers
+        self.indicators = environment.indicators
+        self.block_interval = environment.config.block_interval
         self.merits = {}
         self.transitTimes = {}
-        self.last_time = time.time()
+        self.last_time = self.clock.now()
         self.total_merit = total_merit
 
+        self.addresses = []
+        self.cumulativeMerits = np.zeros(0)
+
         self.v_tokenHolder = self.addVariable("Token Holder", Pyc.TVarType.t_string, "1")
         self.v_tokenGenerated = self.addVariable("Token Generated", Pyc.TVarType.t_bool, False)
-        self.v_meanBlockTime = np.random.exponential(block_interval)
+        self.v_meanBlockTime = self.samplers.exponential.sample() * self.block_interval
 
         self.addMessageBox("Process")
         self.addMessageBoxExport("Process", self.v_tokenHolder, "Token Holder")
@@ -291,7 +502,7 @@ class Oracle(Pyc.CComponent):
         self.processAutomaton.setInitState(self.waiting)
 
         self.waitingToGenerated = self.waiting.addTransition("Waiting-to-Generated")
-        self.waitingToGenerated.setCondition(lambda: time.time() - self.last_time > self.v_meanBlockTime and not self.v_tokenGenerated.value())
+        self.waitingToGenerated.setCondition(lambda: self.clock.now() - self.last_time > self.v_meanBlockTime and not self.v_tokenGenerated.value())
         self.waitingToGenerated.addTarget(self.tokenGenerated)
 
         self.generatedToWaiting = self.tokenGenerated.addTransition("Generated-to-Waiting")
@@ -301,30 +512,37 @@ class Oracle(Pyc.CComponent):
         self.generatedToWaiting.addSensitiveMethod("Select Process", self.selectProcess, 0)
 
 
+    '''
+    Registers the processes and builds the cumulative merit array used to sample the token holder.
+    '''
     def addProcesses(self, processes):
         for i in range(0, len(processes)):
             normalised_merit = processes[i].v_merit.value() / self.total_merit
             self.merits.update({processes[i].v_address.value(): normalised_merit})
             self.transitTimes.update({processes[i].v_address.value(): processes[i].v_connectionSpeed.value()})
+        self.addresses = list(self.merits.keys())
+        self.cumulativeMerits = np.cumsum(list(self.merits.values()))
 
     '''
     Oracle Method to choose the next process to generate the latest block.
     Generates a token and sets the token holder to the chosen process' address.
     Once complete, the last block time is set to the current time to send the oracle back into a waiting state.
+    The holder is found by a binary search of the cumulative merits, so each selection is O(log n).
     '''
     def selectProcess(self):
-        choice = np.random.choice(list(self.merits.keys()), 1, p=list(self.merits.values()))
-        self.v_meanBlockTime = np.random.exponential(block_interval)
-        self.v_tokenHolder.setValue(choice[0])
+        uniform = self.samplers.uniform.sample()
+        index = np.searchsorted(self.cumulativeMerits, uniform * self.cumulativeMerits[-1], side="right")
+        choice = self.addresses[min(index, len(self.addresses) - 1)]
+        self.v_meanBlockTime = self.samplers.exponential.sample() * self.block_interval
+        self.v_tokenHolder.setValue(choice)
         self.v_tokenGenerated.setValue(False)
-        self.last_time = time.time()
-        self.intervalIndicator(intervals)
+        self.last_time = self.clock.now()
+        self.intervalIndicator(self.indicators.intervals)
 
     def intervalIndicator(self, intervals):
         intervals.append(self.v_meanBlockTime)
         if len(intervals) % 10 == 0:
-            interval_averages.append(np.mean(intervals))
-            print(interval_averages[-1], file=open(interval_file, "at"))
+            self.indicators.record("Interval_Averages", np.mean(intervals))
             intervals.clear()
 
     def generate(self):
@@ -333,63 +551,138 @@ class Oracle(Pyc.CComponent):
 
 '''
 Simulator class represents the implemented simulator system.
-Creates and connects the various components outlined above.
+Creates and connects the various components outlined above, according to the given network configuration.
 '''
 class Simulator(Pyc.CSystem):
-    def __init__(self, name):
+    def __init__(self, name, config):
         Pyc.CSystem.__init__(self, name)
 
+        self.config = config
+        self.environment = Environment(config)
+        self.clock = self.environment.clock
+        self.indicators = self.environment.indicators
+        self.genesis = Block(timestamp=self.clock.now(), hashed=config.hash_blocks)
+        process_count = config.process_count
+        genesis = self.genesis
+
         merits = [1] * process_count
-        self.blocktree = Blocktree("Blocktree")
-        self.oracle = Oracle("System Oracle", sum(merits))
+        self.blocktree = Blocktree("Blocktree", genesis, self.environment)
+        self.oracle = Oracle("System Oracle", sum(merits), self.environment)
         self.connect(self.blocktree, "System Oracle", self.oracle, "Blocktree")
         self.processes = []
+        self.tipDepths = np.full(process_count, genesis.depth, dtype=np.int64)
+        self.topology = None
+        if config.topology is not None:
+            self.topology = generateTopology(config, self.environment.samplers.generator)
 
         for i in range(0, process_count):
-            self.processes.append(Process("Process " + str(i + 1), str(i + 1), merits[i], self.blocktree, genesis, self.oracle))
+            self.processes.append(Process("Process " + str(i + 1), str(i + 1), merits[i], self.blocktree, genesis, self.oracle, self.environment))
+            self.processes[i].tipDepths = self.tipDepths
+            self.processes[i].topology = self.topology
             self.connect(self.oracle, "Process", self.processes[i], "Oracle")
             self.connect(self.processes[i], "Blocktree", self.blocktree, "Process")
-            for j in range(0, connection_count):
+            for j in range(0, config.connection_count if config.propagation == "automata" else 0):
                 self.processes[i].connections.append(ProcessConnection("Process" + str(i) + "Connection" + str(j), self.processes[i]))
 
         self.oracle.addProcesses(self.processes)
         self.blocktree.processes = self.processes
 
+        self.instant = None
+        self.consensusSamples = []
+        self.consistencySamples = []
+        self.delaySamples = []
+
     '''
-    Functions to compute the values of the three indicators specified below:
+    Functions to compute the values of the three indicators specified below.
+    Each one is a single vectorised pass over the array of process tip depths.
     '''
     def consensusFunction(self):
-        yesCount = 0
-        counter = 0
-        agree = 0
-        for i in range(0, len(self.processes)):
-            if self.processes[i].knownBlocks[-1].depth == list(self.blocktree.blocks.values())[-1].depth:
-                agree += 1
-        if agree == len(self.processes):
-            yesCount += 1
-        counter += 1
-        return yesCount / counter
+        return float(np.all(self.tipDepths == self.blocktree.height))
 
     def consistencyFunction(self):
-        agree = 0
-        for i in range(0, len(self.processes)):
-            if self.processes[i].knownBlocks[-1].depth == list(self.blocktree.blocks.values())[-1].depth:
-                agree += 1
-        return agree / len(self.processes)
+        return np.count_nonzero(self.tipDepths == self.blocktree.height) / len(self.processes)
 
     def delayFunction(self):
-        differences = []
-        for i in range(0, len(self.processes)):
-            lastBlock = self.processes[i].knownBlocks[-1]
-            differences.append(list(self.blocktree.blocks.values())[-1].depth - lastBlock.depth)
-        return max(differences)
+        return float(self.blocktree.height - self.tipDepths.min())
+
+    '''
+    Event clock handler for the oracle's token, mirrors the oracle and process automata.
+    The selected process creates its block, which is handed to every process that does not know it yet.
+    With a peer-to-peer topology the creator relays it to its neighbours instead.
+    '''
+    def tokenEvent(self):
+        self.oracle.generate()
+        self.oracle.selectProcess()
+        holder = self.processes[int(self.oracle.v_tokenHolder.value()) - 1]
+        holder.consumeToken()
+        block = holder.leadingBlock
+        if self.blocktree.v_appendedBlock.value() == block.id and self.topology is not None:
+            holder.relayBlock(block)
+        elif self.blocktree.v_appendedBlock.value() == block.id:
+            for process in self.processes:
+                if process.isNewBlock(block):
+                    process.newPendingBlock(block)
+        self.clock.schedule(self.oracle.v_meanBlockTime, self.tokenEvent)
+
+    '''
+    Runs a single sequence on the event clock up to tMax simulated seconds.
+    The indicators are sampled every step seconds and their means are returned.
+    The next sampling instant and the samples are kept on the simulator, so a restored checkpoint carries on from them.
+    If given, the checkpoint function is called with the simulator every checkpoint_interval simulated seconds.
+    '''
+    def runEvents(self, tMax, step, checkpoint=None, checkpoint_interval=None):
+        if self.instant is None:
+            self.clock.schedule(self.oracle.v_meanBlockTime, self.tokenEvent)
+            self.instant = 0
+        last_checkpoint = self.instant
+        while self.instant <= tMax:
+            self.clock.run(self.instant)
+            self.consensusSamples.append(self.consensusFunction())
+            self.consistencySamples.append(self.consistencyFunction())
+            self.delaySamples.append(self.delayFunction())
+            self.instant += step
+            if checkpoint is not None and self.instant - last_checkpoint >= checkpoint_interval:
+                checkpoint(self)
+                last_checkpoint = self.instant
+        return np.mean(self.consensusSamples), np.mean(self.consistencySamples), np.mean(self.delaySamples)
 
 
 if __name__ == '__main__':
 
-    simulator = Simulator("Simulator")
+    """
+    The network configuration is read from the JSON file or preset name given on the command line, Bitcoin by default.
+    "--resume <checkpoint>" continues a checkpointed run, adding a seed forks it into a new run under that seed.
+    """
+    checkpoint = None
+    fork_seed = None
+    if len(sys.argv) > 2 and sys.argv[1] == "--resume":
+        checkpoint = sys.argv[2]
+        fork_seed = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        config = checkpointConfig(checkpoint, fork_seed)
+    elif len(sys.argv) > 1 and sys.argv[1].lower() in presets:
+        config = NetworkConfig.preset(sys.argv[1])
+    elif len(sys.argv) > 1:
+        config = NetworkConfig.fromFile(sys.argv[1])
+    else:
+        config = NetworkConfig.preset("bitcoin")
+    simulated_time = config.simulated_time
+
+    profiler = None
+    if config.profile:
+        profiler = Profiler([Process, ProcessConnection, Blocktree, Oracle, Simulator], config.profile_stats)
+        profiler.start()
+
+    simulator = Simulator("Simulator", config)
     simulator.loadParameters("Simulator.xml")
-    simulator.addInstants(0, simulator.tMax(), 60)
+    """
+    A resumed run carries on from the restored clock, its profile only covers the events and simulated seconds from there.
+    """
+    restoredEvents, restoredTime = 0, 0.0
+    if checkpoint is not None:
+        restoreCheckpoint(simulator, checkpoint, fork_seed)
+        restoredEvents, restoredTime = simulator.clock.processed, simulator.clock.now()
+    filename = simulator.environment.filename
+    indicators = simulator.indicators
 
     """
     Defining the system indicators used to quantify the performance of the model.
@@ -397,42 +690,78 @@ if __name__ == '__main__':
     2) Consistency Rate - The proportion of miners which agree on the absolute blockchain
     3) Worst Process Delay - The average difference between the absolute chain and the most delayed process
     """
-    consensusProbability = simulator.addIndicator("Consensus Probability", simulator.consensusFunction)
-    consensusProbability.setRestitutions(Pyc.TIndicatorType.mean_values)
-    consistencyRate = simulator.addIndicator("Consistency Rate", simulator.consistencyFunction)
-    consistencyRate.setRestitutions(Pyc.TIndicatorType.mean_values)
-    worstDelay = simulator.addIndicator("Worst Delay", simulator.delayFunction)
-    worstDelay.setRestitutions(Pyc.TIndicatorType.mean_values)
+    if not simulated_time:
+        simulator.addInstants(0, simulator.tMax(), 60)
+        consensusProbability = simulator.addIndicator("Consensus Probability", simulator.consensusFunction)
+        consensusProbability.setRestitutions(Pyc.TIndicatorType.mean_values)
+        consistencyRate = simulator.addIndicator("Consistency Rate", simulator.consistencyFunction)
+        consistencyRate.setRestitutions(Pyc.TIndicatorType.mean_values)
+        worstDelay = simulator.addIndicator("Worst Delay", simulator.delayFunction)
+        worstDelay.setRestitutions(Pyc.TIndicatorType.mean_values)
 
     """
     Running the simulation, recording its execution time and the results of the indicators.
     The result of the simulation is dumped into a text file with the current timestamp.
+    With simulated time the indicators are sampled by the event clock at the same instants.
+    A resumed run carries on in the output file of the original run, which already holds its heading.
     """
-    printLine("Bitcoin Simulation Run:\n", filename)
+    if checkpoint is None or fork_seed is not None:
+        printLine(config.name + " Simulation Run:\n", filename)
     startTime = time.time()
-    simulator.simulate()
+    if simulated_time and config.checkpoint_interval is not None:
+        save = lambda simulator: saveCheckpoint(simulator, simulator.environment.outputFile("Checkpoint_", ""))
+        meanConsensus, meanConsistency, meanDelay = simulator.runEvents(simulator.tMax(), 60, save, config.checkpoint_interval)
+    elif simulated_time:
+        meanConsensus, meanConsistency, meanDelay = simulator.runEvents(simulator.tMax(), 60)
+    else:
+        simulator.simulate()
     endTime = time.time()
     timeTaken = endTime - startTime
 
-    meanConsensus = list(consensusProbability.means())[0]
-    meanConsistency = list(consistencyRate.means())[0]
-    meanDelay = list(worstDelay.means())[0]
+    if not simulated_time:
+        meanConsensus = list(consensusProbability.means())[0]
+        meanConsistency = list(consistencyRate.means())[0]
+        meanDelay = list(worstDelay.means())[0]
 
     printLine("Time taken: " + str(round(timeTaken, 3)) + " seconds.\n", filename)
     printLine("Network Parameters:", filename)
-    printLine("Number of Nodes: " + str(process_count), filename)
-    printLine("Number of Connections/Node: " + str(connection_count), filename)
-    printLine("Block Interval: " + str(np.mean(interval_averages)), filename)
-    printLine("Block Transit: " + str(np.mean(transit_averages)), filename)
+    printLine("Number of Nodes: " + str(config.process_count), filename)
+    if simulator.topology is not None:
+        printLine("Topology: " + config.topology, filename)
+        printLine("Mean Peers/Node: " + str(round(simulator.topology.meanDegree(), 3)), filename)
+    else:
+        printLine("Number of Connections/Node: " + str(config.connection_count), filename)
+    printLine("Block Interval: " + str(indicators.mean("Interval_Averages")), filename)
+    printLine("Block Transit: " + str(indicators.mean("Transit_Values")), filename)
 
     printLine("\nIndicators:",filename)
     printLine("Mean Consensus Probability: " + str(round(meanConsensus,3)),filename)
     printLine("Mean Consistency: " + str(round(meanConsistency, 3)),filename)
     printLine("Worst Process Delay: " + str(round(meanDelay, 3)), filename)
-    printLine("Block Size: " +  str(np.mean(size_averages)) + "KB", filename)
+    printLine("Block Size: " +  str(indicators.mean("Size_Averages")) + "KB", filename)
 
     printLine("\nBlock Statistics:",filename)
-    printLine("Total # of Blocks: " + str(len(simulator.blocktree.blocks.values()) + len(simulator.blocktree.discarded_blocks)), filename)
-    printLine("# of Valid Blocks: " + str(list(simulator.blocktree.blocks.values())[-1].depth), filename)
-    printLine("# of Orphaned Blocks: " + str(len(simulator.blocktree.blocks.values()) - list(simulator.blocktree.blocks.values())[-1].depth), filename)
-    printLine("# of Invalid Blocks: " + str(len(simulator.blocktree.discarded_blocks)), filename)
+    printLine("Total # of Blocks: " + str(simulator.blocktree.accepted_count + simulator.blocktree.discarded_count), filename)
+    printLine("# of Valid Blocks: " + str(simulator.blocktree.height), filename)
+    printLine("# of Orphaned Blocks: " + str(simulator.blocktree.accepted_count - simulator.blocktree.height), filename)
+    printLine("# of Invalid Blocks: " + str(simulator.blocktree.discarded_count), filename)
+    indicators.metrics.flush()
+    if simulator.environment.blocklog is not None:
+        simulator.environment.blocklog.flush()
+
+    if profiler is not None:
+        profiler.stop()
+        """
+        The PyCATSHOO engine has no event count of its own and runs up to tMax.
+        A resumed run keeps the run id of the original, so its profile goes to files named after the time it resumed at.
+        """
+        if simulated_time:
+            events, simulated = simulator.clock.processed - restoredEvents, simulator.clock.now() - restoredTime
+        else:
+            events, simulated = None, simulator.tMax()
+        resumed = "_Resumed_" + str(restoredTime) if checkpoint is not None and fork_seed is None else ""
+        profile_file = simulator.environment.outputFile("Profile_", resumed + ".txt")
+        printLine("\nProfile:", profile_file)
+        for line in profiler.summary(events, simulated):
+            printLine(line, profile_file)
+        profiler.dumpStats(simulator.environment.outputFile("Profile_", resumed + ".pstats"))
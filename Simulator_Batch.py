@@ -0,0 +1,162 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+
+from Simulator import *
+
+"""
+Default parameter grid, mirroring the node count study found under the Bitcoin Runs folder.
+Every combination of the listed values is run for the given number of replications.
+"""
+grid = {
+    "process_count": [100, 1000, 10000],
+    "connection_count": [3],
+    "block_interval": [5],
+    "transaction_count": [[1650, 1300, 2000]],
+    "transaction_size": [[0.64, 0.41, 0.75]],
+}
+replications = 10
+output_dir = "./Batch Runs/"
+
+"""
+Two-sided 95% Student-t quantiles by degrees of freedom, used for the confidence intervals of the replication means.
+Past the table the normal quantile is close enough.
+"""
+t_quantiles = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262,
+               10: 2.228, 11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131, 16: 2.120, 17: 2.110,
+               18: 2.101, 19: 2.093, 20: 2.086, 21: 2.080, 22: 2.074, 23: 2.069, 24: 2.064, 25: 2.060,
+               26: 2.056, 27: 2.052, 28: 2.048, 29: 2.045, 30: 2.042, 40: 2.021, 60: 2.000, 120: 1.980}
+confidence_z = 1.96
+
+'''
+Student-t quantile for the given degrees of freedom, rounded down to the closest tabulated value so the interval errs on the wide side.
+'''
+def tQuantile(degrees):
+    if degrees > max(t_quantiles):
+        return confidence_z
+    return t_quantiles[max(value for value in t_quantiles if value <= degrees)]
+
+'''
+Expands the parameter grid into the list of parameter combinations to run.
+'''
+def expandGrid(grid):
+    names = list(grid.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+'''
+Builds the configuration of a replication, starting from the preset named in the grid point, Bitcoin by default.
+Run labels start with the batch id, so the output files of separate batches never mix.
+'''
+def replicaConfig(parameters, seed, point, replica, batch_id):
+    values = dict(parameters)
+    values.update({"simulated_time": True, "random_seed": seed, "output_dir": output_dir,
+                   "run_label": batch_id + "_" + str(point) + "_" + str(replica)})
+    return NetworkConfig.preset(values.pop("preset", "bitcoin"), **values)
+
+'''
+Runs a single replication on the event clock and returns its indicators.
+Runs inside a pool worker, so the per-block console messages are silenced.
+'''
+def runReplica(task):
+    point, replica, parameters, seed, tMax, step, batch_id = task
+    config = replicaConfig(parameters, seed, point, replica, batch_id)
+    with open(os.devnull, "w") as devnull:
+        stdout = sys.stdout
+        sys.stdout = devnull
+        try:
+            simulator = Simulator("Simulator", config)
+            consensus, consistency, delay = simulator.runEvents(tMax, step)
+        finally:
+            sys.stdout = stdout
+    simulator.indicators.metrics.flush()
+    if simulator.environment.blocklog is not None:
+        simulator.environment.blocklog.flush()
+
+    blocktree = simulator.blocktree
+    total = blocktree.accepted_count + blocktree.discarded_count
+    stale = (total - blocktree.height) / total
+    return point, {"consensus": consensus, "consistency": consistency, "delay": delay, "stale": stale}
+
+'''
+Mean and half-width of the 95% Student-t confidence interval for a list of replication results.
+'''
+def confidenceInterval(values):
+    values = np.asarray(values, dtype=float)
+    if len(values) < 2:
+        return values.mean(), 0.0
+    return values.mean(), tQuantile(len(values) - 1) * values.std(ddof=1) / np.sqrt(len(values))
+
+'''
+Runs every grid point for the given number of replications in a pool of worker processes.
+Each replication receives an independent seed spawned from the base seed.
+The batch id prefixes the run labels, the start time by default.
+Returns, for each grid point, its parameters and the mean and interval half-width of each indicator.
+'''
+def runBatch(grid, replications, tMax, step=60, workers=None, seed=None, batch_id=None):
+    if batch_id is None:
+        batch_id = str(time.time())
+    points = expandGrid(grid)
+    seeds = np.random.SeedSequence(seed).spawn(len(points) * replications)
+    tasks = []
+    for point, parameters in enumerate(points):
+        for replica in range(0, replications):
+            tasks.append((point, replica, parameters, seeds[point * replications + replica], tMax, step, batch_id))
+
+    os.makedirs(output_dir, exist_ok=True)
+    results = [{} for _ in points]
+    with multiprocessing.Pool(workers) as pool:
+        for point, indicators in pool.imap_unordered(runReplica, tasks):
+            for name, value in indicators.items():
+                results[point].setdefault(name, []).append(value)
+
+    summary = []
+    for point, parameters in enumerate(points):
+        summary.append((parameters, {name: confidenceInterval(values) for name, values in results[point].items()}))
+    return summary
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Runs replicated simulations over a parameter grid.")
+    parser.add_argument("--grid", help="JSON file holding the parameter grid, defaults to the node count study")
+    parser.add_argument("--replications", type=int, default=replications)
+    parser.add_argument("--tmax", type=float, default=10000, help="simulated seconds per replication")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, defaults to every core")
+    parser.add_argument("--seed", type=int, default=None)
+    arguments = parser.parse_args()
+
+    if arguments.grid is not None:
+        with open(arguments.grid) as file:
+            grid = json.load(file)
+
+    batch_id = str(time.time())
+    results_file = output_dir + "Batch_Results_" + batch_id + ".txt"
+    startTime = time.time()
+    summary = runBatch(grid, arguments.replications, arguments.tmax, workers=arguments.workers, seed=arguments.seed,
+                       batch_id=batch_id)
+    timeTaken = time.time() - startTime
+
+    printLine("Batch Simulation Run:\n", results_file)
+    printLine("Time taken: " + str(round(timeTaken, 3)) + " seconds.", results_file)
+    printLine("Replications per Point: " + str(arguments.replications) + "\n", results_file)
+    for point, (parameters, indicators) in enumerate(summary):
+        config = replicaConfig(parameters, None, point, 0, batch_id)
+        printLine("Network Parameters:", results_file)
+        printLine("Number of Nodes: " + str(config.process_count), results_file)
+        if config.topology is not None:
+            printLine("Topology: " + config.topology, results_file)
+            printLine("Topology Degree: " + str(config.topology_degree), results_file)
+        else:
+            printLine("Number of Connections/Node: " + str(config.connection_count), results_file)
+        printLine("Block Interval: " + str(config.block_interval), results_file)
+        printLine("Transaction Count: " + str(config.transaction_count), results_file)
+        printLine("Transaction Size: " + str(config.transaction_size), results_file)
+        printLine("Indicators (mean +/- 95% Student-t interval):", results_file)
+        for label, name in [("Consensus Probability", "consensus"), ("Consistency", "consistency"),
+                            ("Worst Process Delay", "delay"), ("Stale Rate", "stale")]:
+            mean, half_width = indicators[name]
+            printLine(label + ": " + str(round(mean, 3)) + " +/- " + str(round(half_width, 3)), results_file)
+        printLine("", results_file)
@@ -0,0 +1,132 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+
+from Simulator import *
+
+"""
+Fixed-seed benchmark scenarios from 2 to 10,000 processes, run on the event clock with event propagation for the given number of simulated seconds.
+At the preset connection speed a block crosses its connection long before the next one is mined, so the connection count changes nothing.
+The scaling scenarios therefore use a single connection count, while the congested ones slow transits to half a block interval and sweep 1 to 5 connections per process.
+"""
+process_counts = [2, 10, 100, 1000, 10000]
+connection_count = 3
+congested_process_counts = [10, 100, 1000]
+congested_connection_counts = [1, 3, 5]
+congested_connection_speed = 2.5
+simulated_seconds = 600
+benchmark_seed = 2019
+baseline_file = "./benchmark_baseline.json"
+
+"""
+A scenario regresses when its wall time, or the time of one of the tracked components, exceeds the baseline by this ratio.
+Scenarios and components taking less than the minimum time are too noisy to compare.
+"""
+tolerance = 1.25
+minimum_time = 0.25
+tracked_components = ["Blocktree.updateBlocktree", "Oracle.selectProcess", "Process.consumeToken",
+                      "Process.newPendingBlock", "Process.arriveBlock",
+                      "Simulator.consensusFunction", "Simulator.consistencyFunction", "Simulator.delayFunction"]
+
+def scenarios(quick=False):
+    selected = [{"name": str(count) + "x" + str(connection_count), "process_count": count,
+                 "connection_count": connection_count, "connection_speed": None}
+                for count in process_counts]
+    selected += [{"name": str(count) + "x" + str(connections) + "_congested", "process_count": count,
+                  "connection_count": connections, "connection_speed": congested_connection_speed}
+                 for count in congested_process_counts for connections in congested_connection_counts]
+    return [scenario for scenario in selected if not quick or scenario["process_count"] <= 1000]
+
+'''
+Runs one scenario with the hot-path profiler and returns its measurements.
+Each scenario runs in a fresh worker process, so the peak memory reported is its own.
+The profiler's overhead is part of every measurement, baseline included, so the comparison stays fair.
+The run's output files go to a temporary directory, removed once the scenario is done.
+'''
+def runScenario(scenario):
+    output_dir = tempfile.mkdtemp(prefix="Benchmark_")
+    values = {"process_count": scenario["process_count"], "connection_count": scenario["connection_count"],
+              "simulated_time": True, "propagation": "event", "random_seed": benchmark_seed,
+              "output_dir": output_dir + "/", "run_label": "Benchmark_" + scenario["name"]}
+    if scenario["connection_speed"] is not None:
+        values["connection_speed"] = scenario["connection_speed"]
+    config = NetworkConfig.preset("bitcoin", **values)
+    profiler = Profiler([Process, ProcessConnection, Blocktree, Oracle, Simulator])
+    with open(os.devnull, "w") as devnull:
+        stdout = sys.stdout
+        sys.stdout = devnull
+        try:
+            profiler.start()
+            simulator = Simulator("Simulator", config)
+            simulator.runEvents(simulated_seconds, 60)
+            profiler.stop()
+            simulator.indicators.metrics.flush()
+        finally:
+            sys.stdout = stdout
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    return {"name": scenario["name"],
+            "wall_time": profiler.wallTime,
+            "events": simulator.clock.processed,
+            "blocks": simulator.blocktree.accepted_count + simulator.blocktree.discarded_count,
+            "peak_memory_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "components": {label: profiler.times[label] for label in profiler.times if profiler.calls[label] > 0}}
+
+'''
+Compares the results with the baseline and returns a list of regression messages.
+With a fixed seed the processed events must match exactly, a difference means the simulation itself changed.
+'''
+def compare(results, baseline):
+    regressions = []
+    for result in results:
+        reference = baseline.get(result["name"])
+        if reference is None:
+            continue
+        if result["events"] != reference["events"]:
+            regressions.append(result["name"] + ": processed " + str(result["events"]) + " events, baseline " + str(reference["events"]))
+        if max(result["wall_time"], reference["wall_time"]) >= minimum_time and result["wall_time"] > tolerance * reference["wall_time"]:
+            regressions.append(result["name"] + ": wall time " + str(round(result["wall_time"], 3)) + "s, baseline " + str(round(reference["wall_time"], 3)) + "s")
+        for component in tracked_components:
+            current = result["components"].get(component, 0.0)
+            previous = reference["components"].get(component, 0.0)
+            if max(current, previous) >= minimum_time and current > tolerance * previous:
+                regressions.append(result["name"] + ": " + component + " took " + str(round(current, 3)) + "s, baseline " + str(round(previous, 3)) + "s")
+    return regressions
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Runs the fixed-seed scaling benchmarks and compares them with the baseline.")
+    parser.add_argument("--quick", action="store_true", help="skip the 10,000 process scenarios")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--baseline", default=baseline_file)
+    arguments = parser.parse_args()
+
+    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+        results = pool.map(runScenario, scenarios(arguments.quick), chunksize=1)
+
+    width = max(len("Scenario"), *[len(result["name"]) for result in results]) + 2
+    print("{:<{}}{:>12}{:>12}{:>10}{:>14}{:>14}".format("Scenario", width, "Wall (s)", "Events", "Blocks", "Events/sec", "Peak (MB)"))
+    for result in results:
+        print("{:<{}}{:>12.3f}{:>12}{:>10}{:>14.0f}{:>14.1f}".format(
+            result["name"], width, result["wall_time"], result["events"], result["blocks"],
+            result["events"] / max(result["wall_time"], 1e-9), result["peak_memory_mb"]))
+
+    if arguments.save_baseline:
+        with open(arguments.baseline, "w") as file:
+            json.dump({result["name"]: result for result in results}, file, indent=2)
+        print("\nBaseline saved to " + arguments.baseline)
+    elif os.path.exists(arguments.baseline):
+        with open(arguments.baseline) as file:
+            regressions = compare(results, json.load(file))
+        print("\nRegressions:" if len(regressions) > 0 else "\nNo regressions against " + arguments.baseline)
+        for regression in regressions:
+            print("  " + regression)
+        sys.exit(1 if len(regressions) > 0 else 0)
+    else:
+        print("\nNo baseline found, run with --save-baseline to create " + arguments.baseline)
@@ -0,0 +1,369 @@
+import heapq
+import json
+import os
+import shutil
+
+import numpy as np
+
+from Simulator_Config import *
+from Simulator_Utility import *
+
+"""
+Kinds of scheduled events, identified by the method they call.
+"""
+event_kinds = {"tokenEvent": 0, "arrive": 1, "arriveBlock": 2, "arriveRelay": 3}
+
+'''
+Checkpoints snapshot the full state of a simulation running on the event clock into a directory.
+Block data and other large arrays are stored as .npy files, which can be memory-mapped when read back.
+The remaining scalars, the generator state and the configuration are kept in state.json.
+'''
+
+'''
+Describes a scheduled callback as its kind, process index, connection number and block id (-1 when unused).
+'''
+def describeEvent(callback, args):
+    kind = event_kinds[callback.__name__]
+    owner = callback.__self__
+    if kind == 0:
+        return kind, -1, -1, -1
+    if kind == 1:
+        return kind, owner.parent.index, owner.number, -1
+    return kind, owner.index, -1, args[0].id
+
+def rebuildEvent(simulator, blocks, kind, process, connection, block):
+    if kind == 0:
+        return simulator.tokenEvent, ()
+    if kind == 1:
+        return simulator.processes[process].connections[connection].arrive, ()
+    if kind == 2:
+        return simulator.processes[process].arriveBlock, (blocks[block],)
+    return simulator.processes[process].arriveRelay, (blocks[block],)
+
+'''
+Packs a list of integer lists into a flat array and its offsets, the compressed sparse row layout.
+'''
+def packRows(rows):
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(row) for row in rows], out=offsets[1:])
+    values = np.fromiter((value for row in rows for value in row), dtype=np.int64, count=offsets[-1])
+    return values, offsets
+
+def unpackRow(values, offsets, row):
+    return values[offsets[row]:offsets[row + 1]].tolist()
+
+'''
+Blocks held by the blocktree, the processes, their connections and the scheduled events, with their ancestors.
+With a block log these can include finalised blocks dropped from the blocktree.
+'''
+def referencedBlocks(simulator):
+    referenced = list(simulator.blocktree.blocks.values()) + list(simulator.blocktree.discarded_blocks.values())
+    referenced.extend(simulator.blocktree.chain.values())
+    for process in simulator.processes:
+        referenced.extend([process.tip, process.leadingBlock])
+        referenced.extend(process.idleQueue)
+        referenced.extend(args[0] for callback, args in process.waitingArrivals if len(args) > 0)
+        referenced.extend(connection.currentBlock for connection in process.connections if connection.currentBlock is not None)
+    referenced.extend(args[0] for _, _, callback, args in simulator.clock.events if len(args) > 0)
+    blocks = {}
+    for block in referenced:
+        while block is not None and block.id not in blocks:
+            blocks[block.id] = block
+            block = block.father
+    return blocks
+
+'''
+Brings an output file back to its size at the checkpoint, or for a fork copies that part of it to the fork's own file.
+'''
+def restoreFile(filename, saved_filename, size, fork):
+    if not fork and os.path.exists(filename):
+        with open(filename, "r+b") as file:
+            file.truncate(size)
+    elif fork and os.path.exists(saved_filename):
+        with open(saved_filename, "rb") as source, open(filename, "wb") as target:
+            target.write(source.read(size))
+
+'''
+Writes a checkpoint of the simulator to the given directory, replacing any previous checkpoint there.
+The snapshot is first written beside the directory, so a crash while saving leaves the previous checkpoint intact.
+A crash between the two renames of the swap leaves it under path + ".old" only, which checkpointPath falls back to.
+'''
+def saveCheckpoint(simulator, path):
+    if not simulator.config.simulated_time:
+        raise ValueError("Checkpoints require a simulation running on the event clock")
+    path = path.rstrip("/")
+    temporary = path + ".tmp"
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+    arrays = {}
+
+    """
+    Blocks, in the order they were inserted in the blocktree, followed by the discarded ones and any other block still referenced.
+    """
+    blocktree = simulator.blocktree
+    blocks = list(blocktree.blocks.values()) + list(blocktree.discarded_blocks.values())
+    stored = set(blocktree.blocks) | set(blocktree.discarded_blocks)
+    blocks.extend(block for block_id, block in referencedBlocks(simulator).items() if block_id not in stored)
+    arrays["block_id"] = np.array([block.id for block in blocks], dtype=np.int64)
+    arrays["block_father"] = np.array([block.father.id if block.father is not None else -1 for block in blocks], dtype=np.int64)
+    arrays["block_depth"] = np.array([block.depth for block in blocks], dtype=np.int64)
+    arrays["block_timestamp"] = np.array([block.timestamp for block in blocks], dtype=np.float64)
+    arrays["block_size"] = np.array([block.size for block in blocks], dtype=np.float64)
+    arrays["block_transaction_size"] = np.array([block.transaction_size for block in blocks], dtype=np.float64)
+    arrays["block_transaction_count"] = np.array([block.transaction_count for block in blocks], dtype=np.float64)
+    arrays["block_process"] = np.array([int(getattr(block, "process", -1) or -1) for block in blocks], dtype=np.int64)
+    arrays["chain"] = np.array([blocktree.chain[depth].id for depth in sorted(blocktree.chain)], dtype=np.int64)
+    if simulator.config.hash_blocks:
+        arrays["block_hash"] = np.array([block.hash for block in blocks])
+
+    """
+    Per-process state: tips, side and pending ids, idle queues and arrivals waiting for their father.
+    """
+    processes = simulator.processes
+    arrays["process_tip"] = np.array([process.tip.id for process in processes], dtype=np.int64)
+    arrays["process_leading"] = np.array([process.leadingBlock.id for process in processes], dtype=np.int64)
+    arrays["process_free_connections"] = np.array([process.freeConnections for process in processes], dtype=np.int64)
+    arrays["side"], arrays["side_offsets"] = packRows([sorted(process.sideIds) for process in processes])
+    arrays["pending"], arrays["pending_offsets"] = packRows([sorted(process.pendingIds) for process in processes])
+    arrays["idle"], arrays["idle_offsets"] = packRows([[block.id for block in process.idleQueue] for process in processes])
+    arrays["waiting"], arrays["waiting_offsets"] = packRows(
+        [[value for callback, args in process.waitingArrivals for value in describeEvent(callback, args)] for process in processes])
+
+    connection_count = max([len(process.connections) for process in processes] + [0])
+    arrays["connection_block"] = np.full((len(processes), connection_count), -1, dtype=np.int64)
+    arrays["connection_transit"] = np.zeros((len(processes), connection_count), dtype=np.float64)
+    for process in processes:
+        for connection in process.connections:
+            if connection.currentBlock is not None:
+                arrays["connection_block"][process.index, connection.number] = connection.currentBlock.id
+            arrays["connection_transit"][process.index, connection.number] = connection.currentTransitTime or 0.0
+
+    """
+    Scheduled events, the oracle's merits, the indicator arrays, the samples and the random pools.
+    """
+    clock = simulator.clock
+    events = [(event_time, counter) + describeEvent(callback, args) for event_time, counter, callback, args in clock.events]
+    arrays["event_time"] = np.array([event[0] for event in events], dtype=np.float64)
+    arrays["event_descriptor"] = np.array([event[1:] for event in events], dtype=np.int64).reshape(-1, 5)
+    arrays["oracle_merits"] = np.array(list(simulator.oracle.merits.values()), dtype=np.float64)
+    arrays["oracle_cumulative_merits"] = simulator.oracle.cumulativeMerits
+    indicators = simulator.indicators
+    for name in ["intervals", "b_intervals", "transits", "sizes"]:
+        arrays["indicator_" + name] = np.array(getattr(indicators, name), dtype=np.float64)
+    arrays["samples_consensus"] = np.array(simulator.consensusSamples, dtype=np.float64)
+    arrays["samples_consistency"] = np.array(simulator.consistencySamples, dtype=np.float64)
+    arrays["samples_delay"] = np.array(simulator.delaySamples, dtype=np.float64)
+    samplers = simulator.environment.samplers
+    pools = {"uniform": samplers.uniform, "exponential": samplers.exponential,
+             "transaction_size": samplers.transaction_size, "transaction_count": samplers.transaction_count}
+    for name, pool in pools.items():
+        if pool.values is not None:
+            arrays["pool_" + name] = pool.values
+    if simulator.topology is not None:
+        for name in ["indptr", "indices", "latency", "bandwidth"]:
+            arrays["topology_" + name] = getattr(simulator.topology, name)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(temporary, name + ".npy"), array)
+
+    indicators.metrics.flush()
+    metrics_file = indicators.metrics.filename
+    blocklog = simulator.environment.blocklog
+    if blocklog is not None:
+        blocklog.flush()
+    state = {
+        "config": simulator.config.__dict__,
+        "run_id": simulator.environment.run_id,
+        "next_block_id": simulator.environment.next_block_id,
+        "tree_blocks": len(blocktree.blocks),
+        "discarded_blocks": len(blocktree.discarded_blocks),
+        "orphan_count": blocktree.orphan_count,
+        "accepted_count": blocktree.accepted_count,
+        "discarded_count": blocktree.discarded_count,
+        "finalised_depth": blocktree.finalised_depth,
+        "clock": {"time": clock.time, "counter": clock.counter, "processed": clock.processed},
+        "oracle": {"last_time": simulator.oracle.last_time, "mean_block_time": float(simulator.oracle.v_meanBlockTime),
+                   "token_holder": simulator.oracle.v_tokenHolder.value(),
+                   "token_generated": bool(simulator.oracle.v_tokenGenerated.value())},
+        "appended_block": blocktree.v_appendedBlock.value(),
+        "instant": simulator.instant,
+        "generator": samplers.generator.bit_generator.state,
+        "pool_index": {name: pool.index for name, pool in pools.items()},
+        "metrics_counts": indicators.metrics.counts,
+        "indicator_totals": indicators.totals,
+        "metrics_file": metrics_file,
+        "metrics_size": os.path.getsize(metrics_file) if os.path.exists(metrics_file) else 0,
+        "blocklog_file": blocklog.filename if blocklog is not None else None,
+        "blocklog_count": blocklog.count if blocklog is not None else 0,
+        "blocklog_size": os.path.getsize(blocklog.filename) if blocklog is not None and os.path.exists(blocklog.filename) else 0,
+    }
+    with open(os.path.join(temporary, "state.json"), "w") as file:
+        json.dump(state, file)
+
+    previous = path + ".old"
+    if os.path.exists(path):
+        shutil.rmtree(previous, ignore_errors=True)
+        os.rename(path, previous)
+    os.rename(temporary, path)
+    shutil.rmtree(previous, ignore_errors=True)
+
+'''
+Directory holding the checkpoint saved to the given path, the previous checkpoint when a save was cut short mid-swap.
+'''
+def checkpointPath(path):
+    if not os.path.exists(path) and os.path.exists(path + ".old"):
+        return path + ".old"
+    return path
+
+def readState(path):
+    with open(os.path.join(path, "state.json")) as file:
+        return json.load(file)
+
+'''
+Configuration of a checkpointed run, to build the simulator the checkpoint is restored into.
+With a fork seed the run continues under a new seed and its own run label, so many runs can share one warmed-up chain.
+'''
+def checkpointConfig(path, fork_seed=None):
+    state = readState(checkpointPath(path))
+    values = dict(state["config"])
+    values["run_label"] = state["run_id"]
+    if fork_seed is not None:
+        values["random_seed"] = fork_seed
+        values["run_label"] = state["run_id"] + "_fork_" + str(fork_seed)
+    return NetworkConfig(**values)
+
+'''
+Restores a checkpoint into a freshly built simulator of the same configuration.
+Without a fork seed the generator and its pools are restored too, so the run continues with identical random draws.
+'''
+def restoreCheckpoint(simulator, path, fork_seed=None):
+    path = checkpointPath(path)
+    state = readState(path)
+    load = lambda name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+    exists = lambda name: os.path.exists(os.path.join(path, name + ".npy"))
+
+    """
+    Blocks are rebuilt in id order, so every father exists before its children.
+    """
+    ids = np.asarray(load("block_id"))
+    fathers, depths, processes = load("block_father"), load("block_depth"), load("block_process")
+    timestamps, sizes = load("block_timestamp"), load("block_size")
+    transaction_sizes, transaction_counts = load("block_transaction_size"), load("block_transaction_count")
+    hashes = load("block_hash") if exists("block_hash") else None
+    blocks = {}
+    for row in np.argsort(ids, kind="stable").tolist():
+        block = Block.__new__(Block)
+        block.id = int(ids[row])
+        block.father = blocks[int(fathers[row])] if fathers[row] >= 0 else None
+        block.depth = int(depths[row])
+        block.timestamp = float(timestamps[row])
+        block.size = float(sizes[row])
+        block.transaction_size = float(transaction_sizes[row])
+        block.transaction_count = float(transaction_counts[row])
+        block.hash = str(hashes[row]) if hashes is not None else None
+        if processes[row] >= 0:
+            block.process = str(int(processes[row]))
+        blocks[block.id] = block
+
+    blocktree = simulator.blocktree
+    order = ids.tolist()
+    blocktree.blocks = {}
+    blocktree.depths = {}
+    for block_id in order[:state["tree_blocks"]]:
+        blocktree.blocks[block_id] = blocks[block_id]
+        blocktree.depths.setdefault(blocks[block_id].depth, []).append(blocks[block_id])
+    chain = [blocks[block_id] for block_id in load("chain").tolist()]
+    blocktree.chain = {block.depth: block for block in chain}
+    blocktree.tip = chain[-1]
+    blocktree.height = chain[-1].depth
+    discarded_end = state["tree_blocks"] + state["discarded_blocks"]
+    blocktree.discarded_blocks = {block_id: blocks[block_id] for block_id in order[state["tree_blocks"]:discarded_end]}
+    blocktree.orphan_count = state["orphan_count"]
+    blocktree.accepted_count = state["accepted_count"]
+    blocktree.discarded_count = state["discarded_count"]
+    blocktree.finalised_depth = state["finalised_depth"]
+    blocktree.finalised_block = blocktree.chain[blocktree.finalised_depth] if blocktree.blocklog is not None and blocktree.finalised_depth > 0 else None
+    blocktree.rejected_depths = {}
+    if blocktree.blocklog is not None:
+        for block in blocktree.discarded_blocks.values():
+            blocktree.rejected_depths.setdefault(block.depth, []).append(block)
+        blocktree.blocklog.count = state["blocklog_count"]
+        restoreFile(blocktree.blocklog.filename, state["blocklog_file"], state["blocklog_size"], fork_seed is not None)
+    blocktree.v_appendedBlock.setValue(state["appended_block"])
+    simulator.genesis = blocks.get(0, simulator.genesis)
+    simulator.environment.next_block_id = state["next_block_id"]
+
+    """
+    Processes and their connections.
+    """
+    tips, leading, free = load("process_tip"), load("process_leading"), load("process_free_connections")
+    side, side_offsets = np.asarray(load("side")), load("side_offsets")
+    pending, pending_offsets = np.asarray(load("pending")), load("pending_offsets")
+    idle, idle_offsets = np.asarray(load("idle")), load("idle_offsets")
+    waiting, waiting_offsets = np.asarray(load("waiting")), load("waiting_offsets")
+    connection_blocks, connection_transits = load("connection_block"), load("connection_transit")
+    for process in simulator.processes:
+        i = process.index
+        process.sideIds = set(unpackRow(side, side_offsets, i))
+        process.pendingIds = set(unpackRow(pending, pending_offsets, i))
+        process.idleQueue.clear()
+        process.idleQueue.extend(blocks[block_id] for block_id in unpackRow(idle, idle_offsets, i))
+        process.tip = blocks[int(tips[i])]
+        process.leadingBlock = blocks[int(leading[i])]
+        process.tipDepths[i] = process.tip.depth
+        process.freeConnections = int(free[i])
+        descriptors = unpackRow(waiting, waiting_offsets, i)
+        process.waitingArrivals = [rebuildEvent(simulator, blocks, *descriptors[j:j + 4]) for j in range(0, len(descriptors), 4)]
+        for connection in process.connections:
+            block_id = int(connection_blocks[i, connection.number])
+            connection.currentBlock = blocks[block_id] if block_id >= 0 else None
+            connection.currentTransitTime = float(connection_transits[i, connection.number])
+
+    """
+    Event clock, oracle, indicators and samples.
+    """
+    clock = simulator.clock
+    event_times, descriptors = load("event_time"), np.asarray(load("event_descriptor"))
+    clock.events = []
+    for event_time, descriptor in zip(event_times.tolist(), descriptors.tolist()):
+        callback, args = rebuildEvent(simulator, blocks, *descriptor[1:])
+        clock.events.append((event_time, descriptor[0], callback, args))
+    heapq.heapify(clock.events)
+    clock.time = state["clock"]["time"]
+    clock.counter = state["clock"]["counter"]
+    clock.processed = state["clock"]["processed"]
+
+    oracle = simulator.oracle
+    oracle.merits = dict(zip(oracle.addresses, load("oracle_merits").tolist()))
+    oracle.cumulativeMerits = np.array(load("oracle_cumulative_merits"))
+    oracle.last_time = state["oracle"]["last_time"]
+    oracle.v_meanBlockTime = state["oracle"]["mean_block_time"]
+    oracle.v_tokenHolder.setValue(state["oracle"]["token_holder"])
+    oracle.v_tokenGenerated.setValue(state["oracle"]["token_generated"])
+
+    indicators = simulator.indicators
+    indicators.totals = {stream: list(total) for stream, total in state["indicator_totals"].items()}
+    for name in ["intervals", "b_intervals", "transits", "sizes"]:
+        setattr(indicators, name, load("indicator_" + name).tolist())
+    """
+    Metrics recorded after the checkpoint are cut from the file, a fork starts its own file with the rows written so far.
+    """
+    indicators.metrics.counts = dict(state["metrics_counts"])
+    restoreFile(indicators.metrics.filename, state["metrics_file"], state["metrics_size"], fork_seed is not None)
+    simulator.instant = state["instant"]
+    simulator.consensusSamples = load("samples_consensus").tolist()
+    simulator.consistencySamples = load("samples_consistency").tolist()
+    simulator.delaySamples = load("samples_delay").tolist()
+
+    if simulator.topology is not None:
+        for name in ["indptr", "indices", "latency", "bandwidth"]:
+            setattr(simulator.topology, name, np.array(load("topology_" + name)))
+
+    if fork_seed is None:
+        samplers = simulator.environment.samplers
+        samplers.generator.bit_generator.state = state["generator"]
+        pools = {"uniform": samplers.uniform, "exponential": samplers.exponential,
+                 "transaction_size": samplers.transaction_size, "transaction_count": samplers.transaction_count}
+        for name, pool in pools.items():
+            pool.index = state["pool_index"][name]
+            pool.values = np.array(load("pool_" + name)) if exists("pool_" + name) else None
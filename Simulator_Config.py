@@ -0,0 +1,128 @@
+import json
+
+"""
+Preset network properties for the networks studied so far.
+Connection speed is the mean transit time, derived from a reference propagation time scaled to the block interval.
+The Ethereum and arbitrary values approximate the settings behind the Ethereum Runs and Arbitrary Runs folders.
+"""
+presets = {
+    "bitcoin": {
+        "name": "Bitcoin",
+        "process_count": 1000,
+        "connection_count": 3,
+        "block_interval": 5,
+        "transaction_count": [1650, 1300, 2000],
+        "transaction_size": [0.64, 0.41, 0.75],
+        "propagation_time": 8.7,
+        "reference_interval": 600,
+        "output_dir": "./Bitcoin Runs/",
+    },
+    "ethereum": {
+        "name": "Ethereum",
+        "process_count": 1000,
+        "connection_count": 3,
+        "block_interval": 5,
+        "transaction_count": [130, 80, 200],
+        "transaction_size": [0.15, 0.1, 0.3],
+        "propagation_time": 0.5,
+        "reference_interval": 15,
+        "output_dir": "./Ethereum Runs/",
+    },
+    "arbitrary": {
+        "name": "Arbitrary",
+        "process_count": 10,
+        "connection_count": 3,
+        "block_interval": 1,
+        "transaction_count": [1650, 1300, 2000],
+        "transaction_size": [0.64, 0.41, 0.75],
+        "propagation_time": 0.1,
+        "reference_interval": 1,
+        "output_dir": "./Arbitrary Runs/",
+    },
+}
+
+'''
+Network configuration of a single simulation.
+The process count refers to the number of nodes/miners in the system.
+Connection count refers to the number of automaton assigned to each connection to schedule block arrivals.
+Transaction count and size hold the mean, lower and upper bound of their bounded exponential distributions.
+'''
+class NetworkConfig:
+    def __init__(self, name="Bitcoin", process_count=1000, connection_count=3, block_interval=5,
+                 transaction_count=(1650, 1300, 2000), transaction_size=(0.64, 0.41, 0.75),
+                 propagation_time=8.7, reference_interval=600, connection_speed=None,
+                 simulated_time=False, propagation="automata", topology=None, topology_degree=8,
+                 rewiring_probability=0.1, link_latency=None, link_bandwidth=None,
+                 random_seed=None, hash_blocks=False, profile=False, profile_stats=False,
+                 checkpoint_interval=None, confirmation_depth=None, output_dir="./Bitcoin Runs/", run_label=None):
+        self.name = name
+        self.process_count = process_count
+        self.connection_count = connection_count
+        self.block_interval = block_interval
+        self.transaction_count = list(transaction_count)
+        self.transaction_size = list(transaction_size)
+        if connection_speed is None:
+            connection_speed = propagation_time / (reference_interval / block_interval)
+        self.connection_speed = connection_speed
+
+        """
+        Simulated time drives the run from the discrete-event clock instead of the PyCATSHOO engine.
+        Propagation is either "automata", through the connection automata, or "event", where arrivals are scheduled directly on the event clock.
+        The random seed feeds every sampler, None draws a fresh seed for each run.
+        Blocks are identified by integer ids, hashing them with SHA-256 is an opt-in for realism.
+        Profiling times the hot-path methods of the run, profile stats additionally dump cProfile statistics.
+        A checkpoint interval snapshots runs on the event clock every so many simulated seconds, so they can be resumed or forked.
+        With a confirmation depth, blocks that deep below the chain height are streamed to the Blocks_ log and dropped from memory.
+        Output files are written to the output directory, suffixed by the run label or the start time.
+        """
+        self.simulated_time = simulated_time
+        self.propagation = propagation
+
+        """
+        Without a topology every appended block is handed to all processes.
+        A "random-regular", "small-world" or "scale-free" topology instead relays blocks hop by hop between peers.
+        Link latency defaults to the connection speed and link bandwidth (KB/s) to an average block per latency.
+        """
+        self.topology = topology
+        self.topology_degree = topology_degree
+        self.rewiring_probability = rewiring_probability
+        self.link_latency = link_latency
+        self.link_bandwidth = link_bandwidth
+        self.random_seed = random_seed
+        self.hash_blocks = hash_blocks
+        self.profile = profile
+        self.profile_stats = profile_stats
+        self.checkpoint_interval = checkpoint_interval
+        self.confirmation_depth = confirmation_depth
+        self.output_dir = output_dir
+        self.run_label = run_label
+
+        if propagation not in ("automata", "event"):
+            raise ValueError("Unknown propagation mode: " + str(propagation))
+        if propagation == "event" and not simulated_time:
+            raise ValueError("Event propagation requires simulated time")
+        if topology is not None and propagation != "event":
+            raise ValueError("A peer-to-peer topology requires event propagation")
+        if checkpoint_interval is not None and not simulated_time:
+            raise ValueError("Checkpoints require simulated time")
+        if confirmation_depth is not None and confirmation_depth < 1:
+            raise ValueError("The confirmation depth must be at least 1")
+
+    @staticmethod
+    def preset(name, **overrides):
+        values = dict(presets[name.lower()])
+        values.update(overrides)
+        return NetworkConfig(**values)
+
+    '''
+    Loads a configuration from a JSON file.
+    A "preset" entry starts from that preset, the remaining entries override its values.
+    '''
+    @staticmethod
+    def fromFile(path):
+        with open(path) as file:
+            values = json.load(file)
+        name = values.pop("preset", None)
+        if name is not None:
+            return NetworkConfig.preset(name, **values)
+        return NetworkConfig(**values)
@@ -0,0 +1,100 @@
+import cProfile
+import functools
+import resource
+import time
+
+"""
+Hot-path transitions and sensitive methods timed by the profiler, listed per component class.
+"""
+hot_paths = {
+    "Oracle": ["selectProcess", "intervalIndicator"],
+    "Process": ["consumeToken", "newPendingBlock", "workingCondition", "receiveBlock", "blockIndicator",
+                "transitIndicator", "arriveBlock", "relayBlock", "arriveRelay"],
+    "ProcessConnection": ["receiveBlock", "arrive"],
+    "Blocktree": ["updateBlocktree", "staleIndicator"],
+    "Simulator": ["consensusFunction", "consistencyFunction", "delayFunction"],
+}
+
+'''
+Opt-in instrumentation of a simulation run.
+Wraps the hot-path methods of the given component classes to count their calls and time them.
+Timings are inclusive, so a method's time also covers the methods it calls, eg: consumeToken covers updateBlocktree.
+Must be started before the simulator is built, as the automata keep the bound methods they are given.
+'''
+class Profiler:
+    def __init__(self, classes, stats=False):
+        self.classes = classes
+        self.calls = {}
+        self.times = {}
+        self.originals = []
+        self.profile = cProfile.Profile() if stats else None
+        self.startTime = 0
+        self.wallTime = 0
+
+    def wrap(self, cls, name):
+        method = getattr(cls, name)
+        label = cls.__name__ + "." + name
+        self.calls[label] = 0
+        self.times[label] = 0.0
+        calls = self.calls
+        times = self.times
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                times[label] += time.perf_counter() - start
+                calls[label] += 1
+
+        self.originals.append((cls, name, method))
+        setattr(cls, name, timed)
+
+    def start(self):
+        for cls in self.classes:
+            for name in hot_paths.get(cls.__name__, []):
+                if hasattr(cls, name):
+                    self.wrap(cls, name)
+        if self.profile is not None:
+            self.profile.enable()
+        self.startTime = time.perf_counter()
+
+    def stop(self):
+        self.wallTime = time.perf_counter() - self.startTime
+        if self.profile is not None:
+            self.profile.disable()
+        for cls, name, method in reversed(self.originals):
+            setattr(cls, name, method)
+        self.originals = []
+
+    '''
+    Summary of the run as a list of lines: throughput figures followed by one row per instrumented method.
+    Events are the event clock's processed events, or the instrumented calls when the PyCATSHOO engine ran the simulation (None).
+    Simulated is the number of simulated seconds the run covered.
+    '''
+    def summary(self, events, simulated):
+        if events is None:
+            events = sum(self.calls.values())
+        wall = max(self.wallTime, 1e-9)
+        lines = ["Wall time: " + str(round(self.wallTime, 3)) + " seconds",
+                 "Events processed: " + str(events),
+                 "Events/sec: " + str(round(events / wall, 1)),
+                 "Simulated seconds/wall second: " + str(round(simulated / wall, 1))]
+        lines.append("Peak memory: " + str(round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)) + " MB")
+        lines.append("")
+        lines.append("{:<36}{:>12}{:>14}{:>14}{:>10}".format("Method", "Calls", "Total (s)", "Mean (us)", "Wall %"))
+        for label in sorted(self.times, key=self.times.get, reverse=True):
+            calls = self.calls[label]
+            if calls == 0:
+                continue
+            lines.append("{:<36}{:>12}{:>14.3f}{:>14.2f}{:>10.1f}".format(
+                label, calls, self.times[label], 1e6 * self.times[label] / calls, 100 * self.times[label] / wall))
+        return lines
+
+    '''
+    Writes the cProfile statistics in the pstats format, readable with pstats.Stats or snakeviz.
+    '''
+    def dumpStats(self, filename):
+        if self.profile is not None:
+            self.profile.dump_stats(filename)
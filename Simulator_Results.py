@@ -0,0 +1,321 @@
+import argparse
+import concurrent.futures
+import os
+import re
+
+import numpy as np
+
+"""
+Run output folders ingested by default and the dataset they are aggregated into.
+"""
+run_folders = ["./Bitcoin Runs", "./Ethereum Runs", "./Arbitrary Runs"]
+dataset_file = "./results.npz"
+
+"""
+Prefixes of the files written by a run, longest first so that eg: Simulation_Output_ is not taken for Simulation_.
+Summary files hold the printed results, stream files one indicator value per line and metrics files every stream as CSV.
+Older runs suffixed each file with its own time.time(), so files written within a second of each other form one run.
+"""
+summary_prefixes = ["Simulation_Output_", "Simulation_Bounded_", "Simulation_", "Bitcoin_Sim_"]
+stream_prefixes = [("Legit_Interval_Averages", "Legit_Interval_Averages"), ("Interval_Averages", "Interval_Averages"),
+                   ("Transit_Values_", "Transit_Values"), ("Size_Averages", "Size_Averages"),
+                   ("Stale_Percentage", "Stale_Percentage")]
+metrics_prefix = "Metrics_"
+run_window = 1.0
+
+"""
+Summary lines read into the run columns, followed by the block size limit (MB) named by the run folder, eg: "2MB", and the means of the indicator streams.
+Runs are sorted by network and the key columns, node count, connections per node and block size limit.
+The block size column is the measured average block size (KB), so it is not a run parameter.
+"""
+summary_fields = {"Time taken": "time_taken", "Number of Nodes": "process_count",
+                  "Number of Connections/Node": "connection_count", "Block Interval": "block_interval",
+                  "Block Transit": "block_transit", "Mean Consensus Probability": "consensus",
+                  "Mean Consistency": "consistency", "Worst Process Delay": "delay", "Block Size": "block_size",
+                  "Transaction Size": "transaction_size", "Transaction Count": "transaction_count",
+                  "Stale Blocks": "stale_blocks", "Total # of Blocks": "total_blocks",
+                  "# of Valid Blocks": "valid_blocks", "# of Orphaned Blocks": "orphaned_blocks",
+                  "# of Invalid Blocks": "invalid_blocks"}
+stream_names = [name for _, name in stream_prefixes]
+key_columns = ["process_count", "connection_count", "block_limit"]
+text_columns = ["run", "directory", "network", "signature"]
+number_columns = list(summary_fields.values()) + ["block_limit"] + ["mean_" + name.lower() for name in stream_names]
+
+'''
+Kind, stream and label of a run output file, or None for files not written by a run.
+'''
+def classifyFile(name):
+    stem, extension = os.path.splitext(name)
+    if extension == ".csv" and stem.startswith(metrics_prefix):
+        return "metrics", None, stem[len(metrics_prefix):]
+    if extension != ".txt":
+        return None
+    for prefix in summary_prefixes:
+        if stem.startswith(prefix):
+            return "summary", None, stem[len(prefix):]
+    for prefix, stream in stream_prefixes:
+        if stem.startswith(prefix):
+            return "stream", stream, stem[len(prefix):]
+    return None
+
+def timestamp(label):
+    try:
+        return float(label)
+    except ValueError:
+        return None
+
+'''
+Groups the files of a folder into runs, as (label, files) pairs.
+Labelled files group by label, timestamped ones by proximity, a run taking the label of its summary file.
+'''
+def groupFiles(files):
+    runs = {}
+    timed = []
+    for file in files:
+        if timestamp(file[2]) is None:
+            runs.setdefault(file[2], []).append(file)
+        else:
+            timed.append(file)
+
+    timed.sort(key=lambda file: timestamp(file[2]))
+    clusters = []
+    for file in timed:
+        cluster = clusters[-1] if len(clusters) > 0 else None
+        if cluster is None or timestamp(file[2]) - timestamp(cluster[0][2]) > run_window or \
+                any(other[:2] == file[:2] for other in cluster):
+            clusters.append([file])
+        else:
+            cluster.append(file)
+    for cluster in clusters:
+        summaries = [file[2] for file in cluster if file[0] == "summary"]
+        label = summaries[0] if len(summaries) > 0 else cluster[0][2]
+        runs.setdefault(label, []).extend(cluster)
+    return list(runs.items())
+
+'''
+Finds the runs under the given folders, keyed by their folder, relative to the folder's parent, and label.
+'''
+def discoverRuns(folders):
+    runs = {}
+    for folder in folders:
+        base = os.path.dirname(os.path.abspath(folder))
+        for directory, _, names in os.walk(folder):
+            files = []
+            for name in sorted(names):
+                kind = classifyFile(name)
+                if kind is not None:
+                    files.append(kind + (os.path.abspath(os.path.join(directory, name)),))
+            for label, group in groupFiles(files):
+                runs[os.path.relpath(os.path.abspath(directory), base) + "/" + label] = group
+    return runs
+
+'''
+Path, size and modification time of each file of a run, a run whose signature is unchanged is not parsed again.
+'''
+def signature(files):
+    lines = []
+    for file in sorted(files, key=lambda file: file[3]):
+        status = os.stat(file[3])
+        lines.append(file[3] + "\t" + str(status.st_size) + "\t" + str(status.st_mtime_ns))
+    return "\n".join(lines)
+
+def signatureExists(run_signature):
+    return all(os.path.exists(line.split("\t")[0]) for line in run_signature.split("\n") if line != "")
+
+def readNumber(text):
+    match = re.match(r"\s*(-?[\d.]+(?:[eE][-+]?\d+)?)", text)
+    return float(match.group(1)) if match is not None else np.nan
+
+'''
+Reads the results printed at the end of a summary file into the row.
+Block details logged before them reuse some of the field names, so fields are only read once the summary starts.
+'''
+def parseSummary(path, row):
+    started = False
+    with open(path) as file:
+        for line in file:
+            name, _, value = line.partition(":")
+            name = name.strip()
+            if name.endswith("Simulation Run"):
+                row["network"] = name[:-len("Simulation Run")].strip()
+            if name in ("Time taken", "Network Parameters"):
+                started = True
+            if started and name in summary_fields:
+                row[summary_fields[name]] = readNumber(value)
+
+def parseStream(path):
+    with open(path) as file:
+        return [float(line) for line in file if line.strip() != ""]
+
+def parseMetrics(path):
+    streams = {}
+    with open(path) as file:
+        next(file, None)
+        for line in file:
+            stream, sample, value = line.rstrip("\n").split(",")
+            streams.setdefault(stream, []).append((int(sample), float(value)))
+    return {stream: [value for _, value in sorted(samples)] for stream, samples in streams.items()}
+
+'''
+Parses the files of a run into its row of run columns and its indicator streams.
+The network defaults to the first word of the run's top folder and the node count to the "N Nodes" or "N processes" folder.
+'''
+def parseRun(run, files):
+    row = {name: np.nan for name in number_columns}
+    directory = os.path.dirname(run)
+    row.update({"run": run, "directory": directory, "network": directory.split("/")[0].split(" ")[0],
+                "signature": signature(files)})
+    streams = {}
+    for kind, stream, _, path in files:
+        if kind == "summary":
+            parseSummary(path, row)
+        elif kind == "stream":
+            streams[stream] = parseStream(path)
+        else:
+            streams.update(parseMetrics(path))
+
+    if np.isnan(row["process_count"]):
+        match = re.search(r"([\d,]+) (?:Nodes|processes)", directory)
+        if match is not None:
+            row["process_count"] = float(match.group(1).replace(",", ""))
+    match = re.search(r"(?:^|/)(\d+(?:\.\d+)?) ?MB(?:/|$)", directory)
+    if match is not None:
+        row["block_limit"] = float(match.group(1))
+    for name in stream_names:
+        if len(streams.get(name, [])) > 0:
+            row["mean_" + name.lower()] = np.mean(streams[name])
+    return row, streams
+
+'''
+Columnar results dataset: one row per run, with the samples of every indicator stream.
+Samples are stored run after run, those of row i being stream, sample and value[offsets[i]:offsets[i + 1]].
+'''
+class ResultsDataset:
+    def __init__(self, rows=None, streams=None):
+        rows = rows if rows is not None else []
+        streams = streams if streams is not None else []
+        order = sorted(range(len(rows)), key=lambda i: (rows[i]["network"],) + tuple(
+            np.inf if np.isnan(rows[i][name]) else rows[i][name] for name in key_columns) + (rows[i]["run"],))
+
+        self.runs = {name: np.array([rows[i][name] for i in order], dtype=str) for name in text_columns}
+        self.runs.update({name: np.array([rows[i][name] for i in order], dtype=np.float64) for name in number_columns})
+        counts = [sum(len(values) for values in streams[i].values()) for i in order]
+        self.offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+        self.stream = np.array([name for i in order for name, values in streams[i].items() for _ in values], dtype=str)
+        self.sample = np.array([j for i in order for values in streams[i].values() for j in range(len(values))], dtype=np.int64)
+        self.value = np.array([value for i in order for values in streams[i].values() for value in values], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.runs["run"])
+
+    def row(self, i):
+        return {name: column[i] for name, column in self.runs.items()}
+
+    def streams(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        streams = {}
+        for name, value in zip(self.stream[start:end].tolist(), self.value[start:end].tolist()):
+            streams.setdefault(name, []).append(value)
+        return streams
+
+    '''
+    Indices of the runs matching every condition, a value or a (low, high) range for number columns.
+    '''
+    def query(self, **conditions):
+        mask = np.ones(len(self), dtype=bool)
+        for name, condition in conditions.items():
+            column = self.runs[name]
+            if isinstance(condition, tuple):
+                mask &= (column >= condition[0]) & (column <= condition[1])
+            else:
+                mask &= column == condition
+        return np.flatnonzero(mask)
+
+    '''
+    Runs grouped by the values of the given columns, as a dict of key tuples to run indices.
+    Rows are sorted by the key columns, so each group holds consecutive runs, missing values being grouped under None.
+    '''
+    def groups(self, columns):
+        groups = {}
+        for i in range(0, len(self)):
+            key = tuple(self.runs[name][i].item() for name in columns)
+            key = tuple(None if isinstance(value, float) and np.isnan(value) else value for value in key)
+            groups.setdefault(key, []).append(i)
+        return groups
+
+    def save(self, path):
+        arrays = {"runs." + name: column for name, column in self.runs.items()}
+        arrays.update({"samples.offsets": self.offsets, "samples.stream": self.stream,
+                       "samples.sample": self.sample, "samples.value": self.value})
+        np.savez_compressed(path, **arrays)
+
+    @staticmethod
+    def load(path):
+        dataset = ResultsDataset()
+        with np.load(path) as arrays:
+            dataset.runs = {name[len("runs."):]: arrays[name] for name in arrays.files if name.startswith("runs.")}
+            dataset.offsets = arrays["samples.offsets"]
+            dataset.stream = arrays["samples.stream"]
+            dataset.sample = arrays["samples.sample"]
+            dataset.value = arrays["samples.value"]
+        return dataset
+
+'''
+Ingests the run outputs found under the given folders into the dataset file.
+Runs already in the dataset with unchanged files are kept as they are, the new and changed ones are parsed by a pool of threads.
+Runs outside the folders are kept while their files still exist, unless a full ingest is requested.
+A dataset written before one of the columns existed is parsed again in full.
+Returns the dataset, the number of runs parsed and the number kept.
+'''
+def ingest(folders, path=dataset_file, workers=None, full=False):
+    previous = ResultsDataset.load(path) if os.path.exists(path) and not full else ResultsDataset()
+    if any(name not in previous.runs for name in number_columns):
+        previous = ResultsDataset()
+    runs = discoverRuns(folders)
+
+    rows = []
+    streams = []
+    for i in range(0, len(previous)):
+        run = previous.runs["run"][i].item()
+        run_signature = previous.runs["signature"][i].item()
+        files = runs.get(run)
+        if (files is not None and signature(files) == run_signature) or (files is None and signatureExists(run_signature)):
+            rows.append(previous.row(i))
+            streams.append(previous.streams(i))
+            runs.pop(run, None)
+    kept = len(rows)
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        for row, run_streams in pool.map(lambda item: parseRun(*item), runs.items()):
+            rows.append(row)
+            streams.append(run_streams)
+
+    dataset = ResultsDataset(rows, streams)
+    dataset.save(path)
+    return dataset, len(rows) - kept, kept
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Aggregates simulation run outputs into a columnar results dataset.")
+    parser.add_argument("folders", nargs="*", default=run_folders)
+    parser.add_argument("--dataset", default=dataset_file)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--full", action="store_true", help="parse every run again instead of only new and changed ones")
+    arguments = parser.parse_args()
+
+    folders = [folder for folder in arguments.folders if os.path.isdir(folder)]
+    dataset, parsed, kept = ingest(folders, arguments.dataset, arguments.workers, arguments.full)
+    print("Parsed " + str(parsed) + " new or changed runs, kept " + str(kept) + ", " + str(len(dataset)) + " runs in " + arguments.dataset + "\n")
+
+    print("{:<12}{:>8}{:>8}{:>12}{:>7}{:>14}{:>12}{:>13}{:>9}{:>10}".format(
+        "Network", "Nodes", "Conns", "Limit (MB)", "Runs", "Block (KB)", "Consensus", "Consistency", "Delay", "Stale %"))
+    runs = dataset.runs
+    for key, rows in dataset.groups(["network"] + key_columns).items():
+        mean = lambda values: np.nanmean(values) if np.any(~np.isnan(values)) else np.nan
+        stale = 100 * runs["orphaned_blocks"][rows] / runs["total_blocks"][rows]
+        print("{:<12}{:>8.0f}{:>8.0f}{:>12.1f}{:>7}{:>14.1f}{:>12.3f}{:>13.3f}{:>9.3f}{:>10.2f}".format(
+            key[0], *[np.nan if value is None else value for value in key[1:]], len(rows),
+            mean(runs["block_size"][rows]), mean(runs["consensus"][rows]),
+            mean(runs["consistency"][rows]), mean(runs["delay"][rows]), mean(stale)))
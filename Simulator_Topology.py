@@ -0,0 +1,109 @@
+import numpy as np
+
+'''
+Peer-to-peer network topology kept as a compressed sparse row (CSR) adjacency.
+The neighbours of process i are indices[indptr[i]:indptr[i + 1]], each link holding its own latency and bandwidth.
+Both directions of a link share the same latency and bandwidth.
+'''
+class Topology:
+    def __init__(self, process_count, edges, latency, bandwidth):
+        """
+        Builds the adjacency from an array of undirected edges, one row per edge.
+        Self loops and duplicate edges are dropped, the latency and bandwidth of the first copy are kept.
+        """
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        keep = edges[:, 0] != edges[:, 1]
+        edges, latency, bandwidth = edges[keep], np.asarray(latency)[keep], np.asarray(bandwidth)[keep]
+
+        source = np.concatenate([edges[:, 0], edges[:, 1]])
+        target = np.concatenate([edges[:, 1], edges[:, 0]])
+        _, order = np.unique(source * process_count + target, return_index=True)
+        link_latency = np.concatenate([latency, latency])
+        link_bandwidth = np.concatenate([bandwidth, bandwidth])
+
+        self.process_count = process_count
+        self.indices = target[order]
+        self.latency = link_latency[order]
+        self.bandwidth = link_bandwidth[order]
+        self.indptr = np.zeros(process_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(source[order], minlength=process_count), out=self.indptr[1:])
+
+    def degree(self, process):
+        return self.indptr[process + 1] - self.indptr[process]
+
+    def meanDegree(self):
+        return len(self.indices) / self.process_count
+
+    '''
+    Neighbour indices of a process and the delay of sending a block of the given size (KB) over each link.
+    The delay is the link latency plus the transmission time of the block over the link bandwidth.
+    '''
+    def links(self, process, size):
+        start, end = self.indptr[process], self.indptr[process + 1]
+        return self.indices[start:end], self.latency[start:end] + size / self.bandwidth[start:end]
+
+'''
+Near-regular random graph built from the union of degree / 2 random Hamiltonian cycles, plus a random matching for odd degrees.
+Duplicate edges are dropped, so a few processes may end up slightly below the requested degree.
+'''
+def randomRegularEdges(process_count, degree, generator):
+    edges = []
+    for _ in range(0, degree // 2):
+        cycle = generator.permutation(process_count)
+        edges.append(np.stack([cycle, np.roll(cycle, -1)], axis=1))
+    if degree % 2 == 1:
+        matching = generator.permutation(process_count)
+        edges.append(matching[:process_count - process_count % 2].reshape(-1, 2))
+    return np.concatenate(edges)
+
+'''
+Watts-Strogatz small-world graph: a ring lattice where each process links to its degree / 2 nearest neighbours on each side.
+Every link is then rewired to a uniformly chosen process with the given probability.
+'''
+def smallWorldEdges(process_count, degree, rewiring, generator):
+    nodes = np.arange(process_count)
+    edges = np.concatenate([np.stack([nodes, (nodes + j) % process_count], axis=1) for j in range(1, max(degree // 2, 1) + 1)])
+    rewired = generator.random(len(edges)) < rewiring
+    edges[rewired, 1] = generator.integers(0, process_count, np.count_nonzero(rewired))
+    return edges
+
+'''
+Barabasi-Albert scale-free graph, each new process attaching to degree / 2 existing processes chosen proportionally to their degree.
+'''
+def scaleFreeEdges(process_count, degree, generator):
+    links = max(degree // 2, 1)
+    edges = [(i, j) for i in range(0, links + 1) for j in range(i + 1, links + 1)]
+    endpoints = [node for edge in edges for node in edge]
+    for node in range(links + 1, process_count):
+        targets = set()
+        while len(targets) < links:
+            targets.add(endpoints[generator.integers(0, len(endpoints))])
+        for target in targets:
+            edges.append((node, target))
+            endpoints.extend((node, target))
+    return np.array(edges, dtype=np.int64)
+
+'''
+Generates the topology requested by a network configuration.
+Link latencies are exponential around the configured latency, the connection speed by default.
+Link bandwidths (KB per second) vary uniformly within 50% of the configured bandwidth.
+By default the bandwidth lets an average block cross a link in one mean latency.
+'''
+def generateTopology(config, generator):
+    process_count = config.process_count
+    if config.topology == "random-regular":
+        edges = randomRegularEdges(process_count, config.topology_degree, generator)
+    elif config.topology == "small-world":
+        edges = smallWorldEdges(process_count, config.topology_degree, config.rewiring_probability, generator)
+    elif config.topology == "scale-free":
+        edges = scaleFreeEdges(process_count, config.topology_degree, generator)
+    else:
+        raise ValueError("Unknown topology: " + str(config.topology))
+
+    latency = config.link_latency if config.link_latency is not None else config.connection_speed
+    bandwidth = config.link_bandwidth
+    if bandwidth is None:
+        bandwidth = config.transaction_count[0] * config.transaction_size[0] / latency
+    link_latency = generator.exponential(latency, len(edges))
+    link_bandwidth = bandwidth * generator.uniform(0.5, 1.5, len(edges))
+    return Topology(process_count, edges, link_latency, link_bandwidth)
@@ -1,36 +1,88 @@
 from Util import *
+import atexit
 import hashlib
+import heapq
+import os
 import numpy as np
 
 '''
 Block (pure python) class represents a collection of on-chain transactions.
+Slots keep every block free of a per-instance dictionary, and the integer id identifies it within its simulation.
 '''
 class Block:
-    def __init__(self, father = None, process = None, properties = None):
+    __slots__ = ("id", "size", "transaction_size", "transaction_count", "father", "timestamp", "process", "depth", "hash")
+
+    def __init__(self, father = None, process = None, properties = None, timestamp = None, id = 0, hashed = False):
         """
         If the block provided is not the genesis block, create the object according to parent block.
         If the block has no father, ie: is the genesis block of the blockchain, create a preset genesis block.
+        The timestamp defaults to the wall clock unless a simulated time is provided.
+        Blocks are identified by their id, the SHA-256 hash is only computed when hashing is requested.
         """
+        if timestamp is None:
+            timestamp = time.time()
+        self.id = id
         if father is not None:
             self.size = properties[0]
             self.transaction_size = properties[1]
             self.transaction_count = properties[2]
             self.father = father
-            self.timestamp = time.time()
+            self.timestamp = timestamp
             self.process = process
             self.depth = father.depth + 1
-            string_to_hash = father.hash + str(self.timestamp) + process + str(properties[0]) + str(properties[1]) + str(properties[2])
-            hash_object = hashlib.sha256(string_to_hash.encode('utf-8'))
-            self.hash = hash_object.hexdigest()
+            self.hash = None
+            if hashed:
+                string_to_hash = father.hash + str(self.timestamp) + process + str(properties[0]) + str(properties[1]) + str(properties[2])
+                hash_object = hashlib.sha256(string_to_hash.encode('utf-8'))
+                self.hash = hash_object.hexdigest()
         else:
             self.depth = 1
             self.size = 1024
             self.transaction_count = 1650
             self.transaction_size = 0.64
-            self.timestamp = time.time()
+            self.timestamp = timestamp
             self.father = None
-            hash_object = hashlib.sha256(b'genesis')
-            self.hash = hash_object.hexdigest()
+            self.hash = None
+            if hashed:
+                hash_object = hashlib.sha256(b'genesis')
+                self.hash = hash_object.hexdigest()
+
+'''
+Wall clock used by the PyCATSHOO engine, time is read from the machine running the simulation.
+Scheduling is left to the automata conditions, so scheduled events are ignored.
+'''
+class WallClock:
+    def now(self):
+        return time.time()
+
+    def schedule(self, delay, callback, *args):
+        pass
+
+'''
+Discrete-event clock keeping simulated time.
+Events are kept in a priority queue ordered by their firing time and the clock jumps straight to the next one.
+'''
+class EventClock:
+    def __init__(self):
+        self.time = 0.0
+        self.events = []
+        self.counter = 0
+        self.processed = 0
+
+    def now(self):
+        return self.time
+
+    def schedule(self, delay, callback, *args):
+        heapq.heappush(self.events, (self.time + delay, self.counter, callback, args))
+        self.counter += 1
+
+    def run(self, until):
+        while len(self.events) > 0 and self.events[0][0] <= until:
+            event_time, _, callback, args = heapq.heappop(self.events)
+            self.time = event_time
+            self.processed += 1
+            callback(*args)
+        self.time = max(self.time, until)
 
 '''
 Function to generate a random number from an exponential distribution,
@@ -42,9 +94,190 @@ def generateBoundedExponential(values):
         if values[1] < value < values[2]:
             return value
 
+'''
+Metrics writer holding the indicator streams in a memory buffer.
+Samples are flushed in batches, and on exit, to a single CSV file with one row per sample: stream, sample number and value.
+'''
+class MetricsWriter:
+    def __init__(self, filename, batch_size=1000):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.buffer = []
+        self.counts = {}
+        atexit.register(self.flush)
+
+    def record(self, stream, value):
+        sample = self.counts.get(stream, 0)
+        self.counts[stream] = sample + 1
+        self.buffer.append((stream, sample, float(value)))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.buffer) == 0:
+            return
+        header = not os.path.exists(self.filename)
+        with open(self.filename, "at") as file:
+            if header:
+                file.write("stream,sample,value\n")
+            file.writelines(stream + "," + str(sample) + "," + str(value) + "\n" for stream, sample, value in self.buffer)
+        self.buffer.clear()
+
+'''
+Append-only log of the blocks dropped from memory, one fixed-size binary record per block.
+Records are buffered and appended in batches, so the file can be read back or memory-mapped with readBlockLog.
+The status is 0 for main chain blocks, 1 for stale blocks and 2 for rejected blocks, the father and process are -1 when absent.
+'''
+class BlockLog:
+    def __init__(self, filename, hashed=False, batch_size=1000):
+        self.filename = filename
+        self.dtype = blockLogType(hashed)
+        self.hashed = hashed
+        self.batch_size = batch_size
+        self.buffer = []
+        self.count = 0
+        atexit.register(self.flush)
+
+    def append(self, block, status):
+        record = (block.id, block.father.id if block.father is not None else -1, block.depth, block.timestamp,
+                  block.size, block.transaction_size, block.transaction_count,
+                  int(getattr(block, "process", -1) or -1), status)
+        self.buffer.append(record + (block.hash,) if self.hashed else record)
+        self.count += 1
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.buffer) == 0:
+            return
+        with open(self.filename, "ab") as file:
+            np.array(self.buffer, dtype=self.dtype).tofile(file)
+        self.buffer.clear()
+
+def blockLogType(hashed=False):
+    fields = [("id", np.int64), ("father", np.int64), ("depth", np.int64), ("timestamp", np.float64),
+              ("size", np.float64), ("transaction_size", np.float64), ("transaction_count", np.float64),
+              ("process", np.int64), ("status", np.int8)]
+    if hashed:
+        fields.append(("hash", "S64"))
+    return np.dtype(fields)
+
+def readBlockLog(filename, hashed=False):
+    return np.memmap(filename, dtype=blockLogType(hashed), mode="r")
+
+'''
+Pool of random values drawn in large batches from a seedable generator and served one at a time.
+Each subclass provides the vectorised batch draw.
+'''
+class SamplePool:
+    def __init__(self, generator, batch_size=4096):
+        self.generator = generator
+        self.batch_size = batch_size
+        self.values = None
+        self.index = batch_size
+
+    def sample(self):
+        if self.index == self.batch_size:
+            self.values = self.draw(self.batch_size)
+            self.index = 0
+        self.index += 1
+        return self.values[self.index - 1]
+
+    def draw(self, count):
+        raise NotImplementedError
+
+class UniformPool(SamplePool):
+    def draw(self, count):
+        return self.generator.random(count)
+
+'''
+Exponential values with unit mean, scaled by the caller to the required mean.
+'''
+class ExponentialPool(SamplePool):
+    def draw(self, count):
+        return self.generator.standard_exponential(count)
+
+'''
+Bounded exponential values, drawn by inverting the CDF of the exponential truncated to its bounds.
+Takes the same [mean, lower bound, upper bound] values as generateBoundedExponential.
+'''
+class BoundedExponentialPool(SamplePool):
+    def __init__(self, values, generator, batch_size=4096):
+        SamplePool.__init__(self, generator, batch_size)
+        self.mean = values[0]
+        self.lower = np.exp(-values[1] / values[0])
+        self.upper = np.exp(-values[2] / values[0])
+
+    def draw(self, count):
+        return -self.mean * np.log(self.lower - self.generator.random(count) * (self.lower - self.upper))
+
+'''
+The pools shared by the simulator components, all fed by a single generator.
+'''
+class Samplers:
+    def __init__(self, transaction_size, transaction_count, seed=None):
+        self.generator = np.random.default_rng(seed)
+        self.uniform = UniformPool(self.generator)
+        self.exponential = ExponentialPool(self.generator)
+        self.transaction_size = BoundedExponentialPool(transaction_size, self.generator)
+        self.transaction_count = BoundedExponentialPool(transaction_count, self.generator)
+
+'''
+Indicator arrays of a single simulation, used to extract averages, and the writer of their streams.
+The arrays only hold the values since the last average, each average is written to its stream and added to a running total.
+Memory therefore stays bounded however long the run, the means of the averages coming from the totals.
+'''
+class Indicators:
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.intervals = []
+        self.b_intervals = []
+        self.transits = []
+        self.sizes = []
+        self.totals = {}
+
+    def record(self, stream, value):
+        value = float(value)
+        total = self.totals.setdefault(stream, [0.0, 0])
+        total[0] += value
+        total[1] += 1
+        self.metrics.record(stream, value)
+
+    def mean(self, stream):
+        total, count = self.totals.get(stream, [0.0, 0])
+        return total / count if count > 0 else np.nan
+
+'''
+Per-simulation state shared by the components: the network configuration, clock, samplers, indicators and block log.
+Keeping it per instance lets several simulations run in one interpreter without interfering.
+'''
+class Environment:
+    def __init__(self, config):
+        self.config = config
+        self.run_id = config.run_label if config.run_label is not None else str(time.time())
+        self.filename = self.outputFile("Simulation_Output_", ".txt")
+        self.clock = EventClock() if config.simulated_time else WallClock()
+        self.samplers = Samplers(config.transaction_size, config.transaction_count, config.random_seed)
+        self.indicators = Indicators(MetricsWriter(self.outputFile("Metrics_", ".csv")))
+        self.blocklog = None
+        if config.confirmation_depth is not None:
+            self.blocklog = BlockLog(self.outputFile("Blocks_", ".bin"), config.hash_blocks)
+        self.next_block_id = 1
+
+    '''
+    Hands out monotonically increasing block ids, the genesis block holding id 0.
+    '''
+    def newBlockId(self):
+        self.next_block_id += 1
+        return self.next_block_id - 1
+
+    def outputFile(self, prefix, extension):
+        return self.config.output_dir + prefix + self.run_id + extension
+
 def printLine(text, filename):
     print(text)
-    print(text, file=open(filename, "at"))
+    with open(filename, "at") as file:
+        print(text, file=file)
 
 def printBlockDetails(block, filename):
     '''print("Block Created: " + block.hash, file=open(filename, "at"))